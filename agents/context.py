@@ -0,0 +1,122 @@
+import os
+import re
+from functools import lru_cache
+
+from agents.grounding import citation_tag, content_features
+from retrieval.vector_store import resolve_research
+from utils.metrics import record
+
+# Token budget for the evidence part of the writer prompt.
+WRITER_CONTEXT_TOKENS = int(os.getenv("WRITER_CONTEXT_TOKENS", "2500"))
+MAX_SENTENCES_PER_CHUNK = int(os.getenv("WRITER_MAX_SENTENCES", "5"))
+
+# A chunk whose word 5-grams are mostly contained in an already kept chunk is
+# a near-duplicate; overlaps shorter than that (the splitter's 150 chars)
+# are cut from the start of the later chunk instead.
+NEAR_DUPLICATE = 0.8
+MIN_OVERLAP_CHARS = 40
+
+_SENTENCE = re.compile(r"(?<=[.!?])\s+")
+
+
+@lru_cache(maxsize=1)
+def _encoding():
+    try:
+        import tiktoken
+
+        return tiktoken.encoding_for_model("gpt-4o-mini")
+    except Exception:
+        # unknown model or no cached encoding files offline: estimate instead
+        return None
+
+
+def count_tokens(text: str) -> int:
+    enc = _encoding()
+    if enc is None:
+        return max(1, len(text) // 4)
+    return len(enc.encode(text, disallowed_special=()))
+
+
+def _shingles(text: str, n: int = 5) -> frozenset:
+    words = text.lower().split()
+    return frozenset(" ".join(words[i:i + n]) for i in range(max(1, len(words) - n + 1)))
+
+
+def _strip_overlap(other: str, text: str) -> str:
+    # Drop the part of text that repeats other's tail (text follows other in the
+    # document) or other's head (text precedes it): the splitter's overlap.
+    limit = min(len(other), len(text), 300)
+    for size in range(limit, MIN_OVERLAP_CHARS - 1, -1):
+        if other.endswith(text[:size]):
+            return text[size:].lstrip()
+        if other.startswith(text[-size:]):
+            return text[:-size].rstrip()
+    return text
+
+
+def _relevant_sentences(question_features: frozenset, text: str, max_sentences: int) -> str:
+    sentences = [s for s in _SENTENCE.split(" ".join(text.split())) if s]
+    if len(sentences) <= max_sentences:
+        return " ".join(sentences)
+
+    scored = sorted(
+        range(len(sentences)),
+        key=lambda i: (-len(content_features(sentences[i]) & question_features), i),
+    )
+    keep = sorted(scored[:max_sentences])  # original order reads better
+    return " ".join(sentences[i] for i in keep)
+
+
+def _rank_key(item):
+    i, r = item
+    # reranked hits keep the reranker's relevance, fused (RRF) hits their
+    # fused score; otherwise Chroma distance: smaller = closer
+    if r.get("rerank") is not None:
+        return (False, -r["rerank"], i)
+    if r.get("rrf") is not None:
+        return (False, -r["rrf"], i)
+    score = r.get("score")
+    return (score is None, score if score is not None else 0.0, i)
+
+
+def build_context(question: str, research: list, max_tokens: int = WRITER_CONTEXT_TOKENS) -> str:
+    """
+    Writer evidence block under a token budget: chunks in score order,
+    near-duplicates dropped, splitter overlap removed, each chunk trimmed to
+    its most question-relevant sentences. Every kept chunk keeps its exact
+    citation tag.
+    """
+    question_features = content_features(question)
+    research = resolve_research(research)
+    ordered = [r for _, r in sorted(enumerate(research), key=_rank_key)]
+
+    kept = []  # (tag, text, shingles, raw)
+    used = 0
+    dropped = 0
+    for r in ordered:
+        raw = r.get("text") or ""
+        shingles = _shingles(raw)
+        if any(len(shingles & s) >= NEAR_DUPLICATE * len(shingles) for _, _, s, _ in kept):
+            dropped += 1
+            continue
+
+        text = raw
+        for _, _, _, prev in kept:
+            text = _strip_overlap(prev, text)
+        text = _relevant_sentences(question_features, text, MAX_SENTENCES_PER_CHUNK)
+        if not text:
+            dropped += 1
+            continue
+
+        block = f"[{citation_tag(r)}]\n{text}"
+        tokens = count_tokens(block) + 2
+        if kept and used + tokens > max_tokens:
+            dropped += 1
+            continue
+
+        kept.append((citation_tag(r), text, shingles, raw))
+        used += tokens
+
+    record("context_tokens", used)
+    record("context_chunks_dropped", dropped)
+    return "\n\n".join(f"[{tag}]\n{text}" for tag, text, _, _ in kept)
@@ -0,0 +1,115 @@
+import re
+from functools import lru_cache
+
+from retrieval.vector_store import resolve_research
+
+# Citation tags as the writer is told to emit them: [<source> p.<page> <chunk_id>].
+# Several tags may share one bracket, separated by ";" or ",".
+TAG_GROUP = re.compile(r"\[([^\[\]\n]*chunk_[^\[\]\n]*)\]")
+_TAG_SPLIT = re.compile(r"\s*[;,]\s*(?=\S+\.pdf\b|\S*chunk_)")
+# Sentence breaks before a capital letter only, never before "[": a tag run
+# after the full stop ("Claim. [tag]") stays with the claim it cites.
+_SENTENCE = re.compile(r"(?<=[.!?\]])\s+(?=[A-Z])|\n+")
+_TOKEN = re.compile(r"[a-z0-9]+(?:[-'][a-z0-9]+)*")
+
+# Claims whose content words overlap the cited evidence at least this much
+# count as supported; drafts with fewer supported claims than
+# MIN_SUPPORTED_RATIO fail verification as weakly grounded.
+MIN_CLAIM_OVERLAP = 0.25
+MIN_SUPPORTED_RATIO = 0.5
+
+STOPWORDS = frozenset("""
+a an and are as at be been by can could do does for from has have how in into is it its
+may more must of on or our should such than that the their there these this those to
+was we were which while will with within would you your also use used using
+""".split())
+
+
+def citation_tag(r: dict) -> str:
+    return f"{r.get('source')} p.{r.get('page')} {r.get('chunk_id')}"
+
+
+def content_features(text: str) -> frozenset:
+    # content-word unigrams plus bigrams, so phrase matches weigh in
+    words = [w for w in _TOKEN.findall(text.lower()) if w not in STOPWORDS]
+    return frozenset(words + [f"{a} {b}" for a, b in zip(words, words[1:])])
+
+
+@lru_cache(maxsize=256)
+def _build_index(chunks: tuple) -> dict:
+    return {tag: content_features(text) for tag, text in chunks}
+
+
+def citation_index(research: list) -> dict:
+    """tag -> evidence features; memoized on the research set's tags and texts."""
+    research = resolve_research(research)
+    return _build_index(tuple((citation_tag(r), r.get("text") or "") for r in research))
+
+
+def parse_tags(text: str) -> list:
+    tags = []
+    for group in TAG_GROUP.findall(text):
+        tags.extend(t.strip() for t in _TAG_SPLIT.split(group) if t.strip())
+    return tags
+
+
+def check_grounding(draft: str, research: list) -> dict:
+    """
+    Look every cited tag up in the research index and score each cited claim
+    by the share of its content words/bigrams found in the cited chunks.
+    supported_ratio is over the "graded" claims: those with text and at
+    least one resolvable tag. Bare tag lines and claims citing only unknown
+    tags are reported (unknown_tags) but not graded, since stripping the
+    tags repairs them without new evidence. No model calls. Returns:
+      {"claims": [{"text", "tags", "unknown_tags", "overlap", "supported", "graded"}],
+       "unknown_tags": [...], "graded": int, "supported_ratio": float}
+    """
+    index = citation_index(research)
+    claims = []
+    unknown = []
+
+    for sentence in _SENTENCE.split(draft):
+        tags = parse_tags(sentence)
+        if not tags:
+            continue
+
+        known = [t for t in tags if t in index]
+        missing = [t for t in tags if t not in index]
+        unknown.extend(missing)
+
+        claim = " ".join(TAG_GROUP.sub(" ", sentence).split()).strip(" -*|#")
+        claim = re.sub(r"\s+([.,;:!?])", r"\1", claim)
+        features = content_features(claim)
+        if known and features:
+            evidence = frozenset().union(*(index[t] for t in known))
+            overlap = len(features & evidence) / len(features)
+        else:
+            overlap = 0.0
+
+        claims.append({
+            "text": claim,
+            "tags": tags,
+            "unknown_tags": missing,
+            "overlap": round(overlap, 3),
+            # bare tag lines (e.g. the Sources list) just need to resolve
+            "supported": bool(known) and (not features or overlap >= MIN_CLAIM_OVERLAP),
+            "graded": bool(known and features),
+        })
+
+    graded = [c for c in claims if c["graded"]]
+    return {
+        "claims": claims,
+        "unknown_tags": list(dict.fromkeys(unknown)),
+        "graded": len(graded),
+        "supported_ratio": sum(c["supported"] for c in graded) / len(graded) if graded else 0.0,
+    }
+
+
+def strip_unknown_tags(draft: str, research: list) -> str:
+    index = citation_index(research)
+
+    def replace(m):
+        kept = [t for t in parse_tags(m.group(0)) if t in index]
+        return f"[{'; '.join(kept)}]" if kept else ""
+
+    return TAG_GROUP.sub(replace, draft)
@@ -1,14 +1,25 @@
 from dotenv import load_dotenv
 load_dotenv()
-from langchain_openai import ChatOpenAI
+from utils.limits import upstream_limit
+from utils.llm import achat, chat
+from utils.metrics import record_llm_usage
 
 
-
-llm = ChatOpenAI(model="gpt-4o-mini", temperature=0)
-
-def run_planner(question: str) -> str:
-    prompt = f"""
+def build_prompt(question: str) -> str:
+    return f"""
 Create a short action plan to answer this question:
 {question}
 """
-    return llm.invoke(prompt).content
+
+
+def run_planner(question: str) -> str:
+    response = chat(build_prompt(question), "gpt-4o-mini", temperature=0)
+    record_llm_usage(response)
+    return response.content
+
+
+async def arun_planner(question: str) -> str:
+    async with upstream_limit("chat"):
+        response = await achat(build_prompt(question), "gpt-4o-mini", temperature=0)
+    record_llm_usage(response)
+    return response.content
@@ -0,0 +1,86 @@
+import re
+
+from agents.grounding import strip_unknown_tags
+from agents.verifier import SUMMARY_MAX_WORDS, _extract_exec_summary
+from retrieval.vector_store import resolve_research
+from utils.llm import chat
+from utils.metrics import record, record_llm_usage
+
+_FAKE_TAG = re.compile(r"\[\s*source[^\]]*\]", re.IGNORECASE)
+
+
+def _tag(r: dict) -> str:
+    return f"{r['source']} p.{r['page']} {r['chunk_id']}"
+
+
+def fix_source_tags(draft: str, research: list) -> str:
+    # "[Source: X.pdf p.3 chunk_ab]" -> "[X.pdf p.3 chunk_ab]" when the inner tag
+    # is real; otherwise the invented tag is dropped.
+    known = {_tag(r) for r in resolve_research(research)}
+
+    def replace(m):
+        inner = re.sub(r"^\[\s*source\s*[:\-]?\s*", "", m.group(0), flags=re.IGNORECASE).rstrip("]").strip()
+        return f"[{inner}]" if inner in known else ""
+
+    return _FAKE_TAG.sub(replace, draft)
+
+
+def trim_sentences(text: str, max_words: int = SUMMARY_MAX_WORDS) -> str:
+    # Keep whole leading sentences (citation tags stay with their sentence).
+    kept, words = [], 0
+    for sentence in re.split(r"(?<=[.!?])\s+|(?<=\])\s+(?=[A-Z])", text.strip()):
+        n = len(sentence.split())
+        if words + n > max_words:
+            break
+        kept.append(sentence)
+        words += n
+    return " ".join(kept)
+
+
+def write_summary(question: str, draft: str) -> str:
+    # Small prompt: only the draft itself, no retrieval context.
+    prompt = f"""
+Write the Executive Summary section (MAX {SUMMARY_MAX_WORDS} words) for the answer below.
+Use only facts and citation tags that already appear in the answer, copied exactly.
+Return only the summary text, without a heading.
+
+Question:
+{question}
+
+Answer:
+{draft}
+"""
+    response = chat(prompt, "gpt-4o-mini", temperature=0)
+    record_llm_usage(response)
+    return response.content.strip()
+
+
+def repair_draft(question: str, draft: str, failures: list, research: list) -> str:
+    """Fix format-only verifier failures without new retrieval or a full rewrite."""
+    codes = {f["code"] for f in failures}
+
+    if "fake_source_tag" in codes:
+        draft = fix_source_tags(draft, research)
+        record("repairs_deterministic")
+
+    if "unknown_citation" in codes:
+        draft = strip_unknown_tags(draft, research)
+        record("repairs_deterministic")
+
+    if "missing_summary" in codes:
+        summary = trim_sentences(write_summary(question, draft))
+        draft = f"### Executive Summary\n{summary}\n\n{draft.lstrip()}"
+        record("repairs_rewrite")
+
+    elif "summary_too_long" in codes:
+        summary = _extract_exec_summary(draft)
+        trimmed = trim_sentences(summary)
+        if not trimmed:
+            # a single overlong sentence: regenerate just this section
+            trimmed = trim_sentences(write_summary(question, draft))
+            record("repairs_rewrite")
+        else:
+            record("repairs_deterministic")
+        draft = draft.replace(summary, trimmed, 1)
+
+    return draft
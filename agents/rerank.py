@@ -0,0 +1,79 @@
+import os
+
+import numpy as np
+
+from agents.grounding import content_features
+from utils.metrics import record
+
+# Scorer used by the researcher to cut the fused candidates down to the
+# chunks the writer sees. Scorers take (question, hits, n) and return the
+# chosen hits, best first; register_scorer() adds more (e.g. a model-based one).
+RERANKER = os.getenv("RERANKER", "mmr")
+
+# Relevance = LEXICAL_WEIGHT * question/chunk overlap + the rest from the
+# candidate's fused retrieval rank. MMR_LAMBDA trades relevance for
+# diversity (1.0 = relevance only).
+LEXICAL_WEIGHT = float(os.getenv("RERANK_LEXICAL_WEIGHT", "0.5"))
+MMR_LAMBDA = float(os.getenv("RERANK_MMR_LAMBDA", "0.7"))
+
+
+def _feature_matrix(texts: list) -> np.ndarray:
+    features = [content_features(t) for t in texts]
+    vocab = {}
+    for f in features:
+        for term in f:
+            vocab.setdefault(term, len(vocab))
+
+    matrix = np.zeros((len(texts), max(1, len(vocab))), dtype=np.float32)
+    for row, f in enumerate(features):
+        matrix[row, [vocab[t] for t in f]] = 1.0
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.where(norms == 0, 1.0, norms)
+
+
+def mmr_scorer(question: str, hits: list, n: int) -> list:
+    """
+    Maximal marginal relevance over binary unigram/bigram vectors: pick the
+    most relevant chunk, then repeatedly the one that is relevant but least
+    similar to what is already picked. Hits arrive in fused retrieval order.
+    """
+    if len(hits) <= 1:
+        return list(hits)
+
+    matrix = _feature_matrix([question] + [h.get("text") or "" for h in hits])
+    query, docs = matrix[0], matrix[1:]
+    prior = 1.0 - np.arange(len(hits), dtype=np.float32) / len(hits)
+    relevance = LEXICAL_WEIGHT * (docs @ query) + (1.0 - LEXICAL_WEIGHT) * prior
+    similarity = docs @ docs.T
+
+    chosen = []
+    redundancy = np.zeros(len(hits), dtype=np.float32)  # max similarity to chosen
+    available = np.ones(len(hits), dtype=bool)
+    for _ in range(min(n, len(hits))):
+        scores = np.where(available, MMR_LAMBDA * relevance - (1.0 - MMR_LAMBDA) * redundancy, -np.inf)
+        best = int(np.argmax(scores))
+        chosen.append(best)
+        available[best] = False
+        redundancy = np.maximum(redundancy, similarity[best])
+
+    return [dict(hits[i], rerank=round(float(relevance[i]), 4)) for i in chosen]
+
+
+def passthrough_scorer(question: str, hits: list, n: int) -> list:
+    return list(hits[:n])
+
+
+SCORERS = {"mmr": mmr_scorer, "none": passthrough_scorer}
+
+
+def register_scorer(name: str, scorer):
+    SCORERS[name] = scorer
+
+
+def rerank(question: str, hits: list, n: int, scorer: str = None) -> list:
+    name = scorer or RERANKER
+    if name not in SCORERS:
+        raise ValueError(f"Unknown reranker: {name}")
+    selected = SCORERS[name](question, hits, n)
+    record("rerank_candidates", len(hits))
+    return selected
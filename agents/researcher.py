@@ -1,26 +1,78 @@
-from retrieval.vector_store import retrieve
+from agents.rerank import rerank
+from retrieval.chunk_store import to_refs
+from retrieval.vector_store import (
+    RETRIEVAL_MODE,
+    aretrieve_hybrid,
+    aretrieve_many,
+    retrieve_hybrid,
+    retrieve_many,
+    store,
+)
 
-def run_researcher(question: str, k: int = 5):
-    overfetch = max(30, k * 10)
+# Expansion queries that don't depend on the question. Hybrid mode matches
+# them lexically only; in vector mode their embeddings are served from the
+# query-embedding cache after warm_static_queries().
+STATIC_QUERIES = [
+    "AI copilot hospital operations governance oversight EHR integration",
+    "alert fatigue privacy-preserving techniques regulatory compliance",
+]
 
-    queries = [
+
+def warm_static_queries():
+    if RETRIEVAL_MODE != "hybrid":
+        store.query_cache().warm(STATIC_QUERIES)
+
+
+def semantic_queries(question: str) -> list:
+    return [
         question,
         f"hospital AI adoption operations workflow integration {question}",
-        f"AI copilot hospital operations governance oversight EHR integration",
-        f"alert fatigue privacy-preserving techniques regulatory compliance",
     ]
 
-    all_results = []
-    for q in queries:
-        all_results.extend(retrieve(q, k=overfetch))
 
-    # dedupe by (source,page,chunk_id), keep best (lowest distance score)
-    best = {}
-    for r in all_results:
-        key = (r.get("source"), r.get("page"), r.get("chunk_id"))
-        if key not in best or r["score"] < best[key]["score"]:
-            best[key] = r
+def research_queries(question: str) -> list:
+    return [*semantic_queries(question), *STATIC_QUERIES]
+
+
+def warm_research_queries(questions: list, mode: str = RETRIEVAL_MODE):
+    # One batched embedding request for every query a set of questions will
+    # search with (exact-term queries in hybrid mode never get embedded).
+    if mode == "hybrid":
+        index = store.lexical()
+        queries = [q for question in questions for q in semantic_queries(question)]
+        queries = [q for q in queries if not index.is_exact_term_query(q)]
+    else:
+        queries = [q for question in questions for q in research_queries(question)]
+    store.query_cache().warm(queries)
+
+
+def candidate_count(k: int) -> int:
+    # fused candidates handed to the reranker; the writer gets k of them
+    return max(20, k * 3)
+
+
+def _retrieve_candidates(question: str, k: int, fusion: str, mode: str):
+    n = candidate_count(k)
+    if mode == "hybrid":
+        # keyword expansions only go to the local BM25 index (no embeddings),
+        # and the vector side needs a much smaller overfetch
+        return retrieve_hybrid(semantic_queries(question), k=n, lexical_queries=STATIC_QUERIES)
+
+    # one batched embed + one batched backend search, deduped by (source,page,chunk_id);
+    # "min" keeps the best distance, "rrf" fuses per-query ranks
+    return retrieve_many(research_queries(question), k=n, n_results=max(30, k * 10), fusion=fusion)
+
+
+def run_researcher(question: str, k: int = 5, fusion: str = "min", mode: str = RETRIEVAL_MODE):
+    candidates = _retrieve_candidates(question, k, fusion, mode)
+    # graph state keeps only chunk IDs and scores; text is resolved on use
+    return to_refs(rerank(question, candidates, k))
+
 
-    # sort by score ascending (Chroma distance: smaller = closer)
-    merged = sorted(best.values(), key=lambda x: x["score"])
-    return merged[:max(10, k)]  
+async def arun_researcher(question: str, k: int = 5, fusion: str = "min", mode: str = RETRIEVAL_MODE):
+    n = candidate_count(k)
+    if mode == "hybrid":
+        candidates = await aretrieve_hybrid(semantic_queries(question), k=n, lexical_queries=STATIC_QUERIES)
+    else:
+        candidates = await aretrieve_many(research_queries(question), k=n, n_results=max(30, k * 10), fusion=fusion)
+    return to_refs(rerank(question, candidates, k))
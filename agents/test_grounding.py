@@ -0,0 +1,49 @@
+from agents.grounding import check_grounding
+from agents.verifier import verify_draft
+
+RESEARCH = [
+    {"source": "A.pdf", "page": 1, "chunk_id": "chunk_aaa",
+     "text": "Hospitals should establish an AI governance committee to oversee clinical copilots."},
+    {"source": "B.pdf", "page": 2, "chunk_id": "chunk_bbb",
+     "text": "Clinicians must review model outputs before they reach patient records."},
+]
+
+
+def test_tag_after_full_stop_stays_with_its_claim():
+    draft = "### Executive Summary\nThe moon is made of cheese and bananas are blue. [A.pdf p.1 chunk_aaa]"
+    grounding = check_grounding(draft, RESEARCH)
+    assert [c["text"] for c in grounding["claims"]] == ["The moon is made of cheese and bananas are blue."]
+    assert grounding["supported_ratio"] == 0.0
+    assert not verify_draft(draft, RESEARCH)["verified"]
+
+
+def test_each_tag_scores_the_sentence_before_it():
+    draft = (
+        "### Executive Summary\n"
+        "Hospitals should establish an AI governance committee. [A.pdf p.1 chunk_aaa] "
+        "Clinicians must review model outputs. [B.pdf p.2 chunk_bbb]\n"
+        "### Sources\n- [A.pdf p.1 chunk_aaa]\n- [B.pdf p.2 chunk_bbb]"
+    )
+    grounding = check_grounding(draft, RESEARCH)
+    assert grounding["graded"] == 2
+    assert grounding["supported_ratio"] == 1.0
+    assert verify_draft(draft, RESEARCH)["verified"]
+
+
+def test_unknown_tags_are_repaired_not_researched():
+    draft = (
+        "### Executive Summary\n"
+        "Hospitals should establish an AI governance committee. [A.pdf p.1 chunk_aaa] "
+        "Patients prefer copilots. [Z.pdf p.9 chunk_zzz]"
+    )
+    result = verify_draft(draft, RESEARCH)
+    codes = {f["code"] for f in result["failures"]}
+    assert codes == {"unknown_citation"}
+    assert all(f["repair"] == "deterministic" for f in result["failures"])
+
+
+if __name__ == "__main__":
+    for name, fn in list(globals().items()):
+        if name.startswith("test_"):
+            fn()
+            print("ok", name)
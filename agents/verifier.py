@@ -1,5 +1,22 @@
 import re
 
+from agents.grounding import MIN_SUPPORTED_RATIO, check_grounding
+
+SUMMARY_MAX_WORDS = 150
+
+# How each failure can be fixed:
+#   "deterministic": patched in place without any model call
+#   "rewrite":       only the failing section is regenerated with a small prompt
+#   "research":      evidence is insufficient; fetch more and write a new draft
+REPAIR_STRATEGY = {
+    "fake_source_tag": "deterministic",
+    "summary_too_long": "deterministic",
+    "missing_summary": "rewrite",
+    "unknown_citation": "deterministic",
+    "missing_citation": "research",
+    "weak_grounding": "research",
+}
+
 
 def _extract_exec_summary(text: str) -> str:
     # Find section that starts with "Executive Summary"
@@ -9,23 +26,64 @@ def _extract_exec_summary(text: str) -> str:
     return m.group(1).strip()
 
 
-def run_verifier(draft: str, research: list = None) -> bool:
-    # 1) block fake tag 
+def _failure(code: str, message: str, **details) -> dict:
+    return {"code": code, "repair": REPAIR_STRATEGY[code], "message": message, **details}
+
+
+def verify_draft(draft: str, research: list = None) -> dict:
+    """
+    Check a draft and report every failure, not just the first.
+    Returns {"verified": bool, "failures": [{"code", "repair", "message", ...}],
+    "grounding": per-claim citation results (see grounding.check_grounding)}.
+    """
+    failures = []
+
+    # 1) block fake tag
     if "[source" in draft.lower():
-        return False
+        failures.append(_failure("fake_source_tag", "Draft contains invented [Source ...] tags."))
 
     # 2) must contain at least one citation tag like [something]
     if not re.search(r"\[[^\]]+\]", draft):
-        return False
+        failures.append(_failure("missing_citation", "Draft has no citation tags."))
 
     # 3) enforce executive summary word count
     exec_summary = _extract_exec_summary(draft)
     if exec_summary:
         words = len(exec_summary.split())
-        if words > 150:
-            return False
+        if words > SUMMARY_MAX_WORDS:
+            failures.append(_failure(
+                "summary_too_long",
+                f"Executive Summary has {words} words (max {SUMMARY_MAX_WORDS}).",
+                words=words,
+            ))
     else:
         # if can't find the section, fail
-        return False
+        failures.append(_failure("missing_summary", "Executive Summary section not found."))
 
-    return True
+    # 4) cited tags must exist in research, and cited claims must overlap their evidence
+    grounding = {"claims": [], "unknown_tags": [], "graded": 0, "supported_ratio": 0.0}
+    if research:
+        grounding = check_grounding(draft, research)
+        if grounding["unknown_tags"]:
+            failures.append(_failure(
+                "unknown_citation",
+                f"{len(grounding['unknown_tags'])} citation tag(s) not found in research.",
+                tags=grounding["unknown_tags"],
+            ))
+        # only claims with a resolvable tag are graded: an unknown tag alone is
+        # fixed by repair (unknown_citation), not by another retrieval round
+        if grounding["graded"] and grounding["supported_ratio"] < MIN_SUPPORTED_RATIO:
+            failures.append(_failure(
+                "weak_grounding",
+                f"Only {grounding['supported_ratio']:.0%} of cited claims overlap their cited evidence.",
+            ))
+
+    return {"verified": not failures, "failures": failures, "grounding": grounding}
+
+
+def needs_research(failures: list) -> bool:
+    return any(f["repair"] == "research" for f in failures)
+
+
+def run_verifier(draft: str, research: list = None) -> bool:
+    return verify_draft(draft, research)["verified"]
@@ -1,17 +1,13 @@
-from langchain_openai import ChatOpenAI
+from agents.context import build_context
+from utils.limits import upstream_limit
+from utils.metrics import record_llm_usage
+from utils.llm import astream_chat, stream_chat
 
 
-def run_writer(question: str, research: list):
-    llm = ChatOpenAI(model="gpt-4o-mini", temperature=0)
-
-    context = "\n\n".join(
-        [
-            f"[{r['source']} p.{r['page']} {r['chunk_id']}]\n{r['text']}"
-            for r in research
-        ]
-    )
+def build_prompt(question: str, research: list) -> str:
+    context = build_context(question, research)
 
-    prompt = f"""
+    return f"""
 You are an enterprise healthcare AI consultant.
 
 CRITICAL CITATION RULES:
@@ -24,7 +20,7 @@ You must produce a structured response with the following sections:
 1. Executive Summary (MAX 150 words)
    - STRICT LIMIT: 150 words maximum.
    - If longer than 150 words, rewrite until it is <=150 words.
-   - Must include inline citation tags like [HIMSS_AI_Adoption_Hospitals.pdf p.1 chunk_576].
+   - Must include inline citation tags like [HIMSS_AI_Adoption_Hospitals.pdf p.1 chunk_3f9a1c0b2d4e].
 
 2. Client-ready Email
    - Professional tone
@@ -52,5 +48,33 @@ Question:
 {question}
 """
 
-    response = llm.invoke(prompt)
-    return response.content
+
+def stream_writer(question: str, research: list):
+    # Yields the draft token by token; LangGraph's "messages" stream mode
+    # picks these up as token events for the writer node.
+    usage = None
+    for chunk in stream_chat(build_prompt(question, research), "gpt-4o-mini", temperature=0, stream_usage=True):
+        if chunk.usage_metadata:
+            usage = chunk
+        if chunk.content:
+            yield chunk.content
+    record_llm_usage(usage)
+
+
+def run_writer(question: str, research: list):
+    return "".join(stream_writer(question, research))
+
+
+async def astream_writer(question: str, research: list):
+    usage = None
+    async with upstream_limit("chat"):
+        async for chunk in astream_chat(build_prompt(question, research), "gpt-4o-mini", temperature=0, stream_usage=True):
+            if chunk.usage_metadata:
+                usage = chunk
+            if chunk.content:
+                yield chunk.content
+    record_llm_usage(usage)
+
+
+async def arun_writer(question: str, research: list):
+    return "".join([token async for token in astream_writer(question, research)])
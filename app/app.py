@@ -1,5 +1,6 @@
 import sys
 import json
+import html
 from pathlib import Path
 from typing import List, Any
 
@@ -10,9 +11,8 @@ load_dotenv()
 
 import streamlit as st
 from graph.workflow import build_graph
-
-# Prompt injection guard
-from utils.security import is_prompt_injection
+from retrieval.vector_store import resolve_research
+from utils.metrics import summarize
 
 
 # Page config
@@ -43,6 +43,8 @@ if "last_result" not in st.session_state:
     st.session_state["last_result"] = None
 if "last_error" not in st.session_state:
     st.session_state["last_error"] = None
+if "rejected_drafts" not in st.session_state:
+    st.session_state["rejected_drafts"] = 0
 
 # sample queries UI state
 if "selected_example" not in st.session_state:
@@ -71,6 +73,7 @@ def clear_all():
     st.session_state["status"] = "Ready"
     st.session_state["last_result"] = None
     st.session_state["last_error"] = None
+    st.session_state["rejected_drafts"] = 0
     st.rerun()
 
 
@@ -118,7 +121,8 @@ def render_sources_list(research):
     if not research:
         st.info("No research chunks returned.")
         return
-    for i, r in enumerate(research, start=1):
+    # state holds chunk IDs and scores; source/page come from the chunk store
+    for i, r in enumerate(resolve_research(research), start=1):
         source = r.get("source", "unknown_source")
         page = r.get("page", "?")
         chunk_id = r.get("chunk_id", "chunk_?")
@@ -129,6 +133,25 @@ def render_sources_list(research):
             st.write(f"{i}. {source} p.{page} {chunk_id} (score={score})")
 
 
+def render_grounding(grounding: dict):
+    claims = [c for c in grounding.get("claims", []) if c.get("text")]
+    if not claims:
+        return
+
+    supported = sum(1 for c in claims if c["supported"])
+    with st.expander(f"Citation check: {supported}/{len(claims)} cited claims supported by their sources"):
+        for c in claims:
+            if c["unknown_tags"]:
+                icon, note = "❌", "unknown tag: " + ", ".join(c["unknown_tags"])
+            elif c["supported"]:
+                icon, note = "✅", f"overlap {c['overlap']:.0%}"
+            else:
+                icon, note = "⚠️", f"weak overlap {c['overlap']:.0%}"
+            # claim text and tags come from the model (and may echo PDF or user
+            # text), so they're escaped before going into HTML
+            st.markdown(f"{icon} {html.escape(c['text'])}  \n<small>{html.escape(note)}</small>", unsafe_allow_html=True)
+
+
 def load_sample_queries(path: Path) -> List[str]:
     """
     Supports:
@@ -176,10 +199,65 @@ def set_question_from_example():
         st.session_state["question"] = selected.strip()
 
 
+NODE_LABELS = {
+    "guard": "Checking request...",
+    "planner": "Planning...",
+    "researcher": "Retrieving evidence...",
+    "writer": "Drafting answer...",
+    "verifier": "Verifying citations...",
+    "repair": "Repairing draft...",
+}
+
+
+def run_streaming(state: dict) -> dict:
+    """
+    Runs the workflow through app.stream_events and renders the writer's
+    draft as it is generated. Rejected drafts stay visible, marked as such,
+    until the next attempt starts streaming.
+    """
+    progress = st.empty()
+    notice = st.empty()
+    live = st.empty()
+
+    draft = ""
+    rejected = 0
+    result = {}
+    progress.caption("Running workflow...")
+
+    for event in app.stream_events(state):
+        kind = event["type"]
+        if kind == "token":
+            if not draft:
+                notice.empty()
+            draft += event["text"]
+            live.markdown(draft + " ▌")
+        elif kind == "node":
+            progress.caption(NODE_LABELS.get(event["node"], "Running workflow..."))
+            if event["node"] == "writer":
+                live.markdown(draft)
+            elif event["node"] == "repair":
+                draft = event["update"].get("draft", "")
+                notice.empty()
+                live.markdown(draft)
+        elif kind == "rejected":
+            rejected += 1
+            reasons = "; ".join(f["message"] for f in event.get("failures", [])) or "missing or invalid citations"
+            notice.warning(f"Draft {rejected} was rejected by the verifier ({reasons}). It is not the final answer.")
+            draft = ""
+        elif kind == "final":
+            result = event["state"]
+
+    progress.empty()
+    notice.empty()
+    live.empty()
+    st.session_state["rejected_drafts"] = rejected
+    return result
+
+
 def security_summary_text() -> str:
     return (
         "Injection Guard is enabled. Queries that try to override system rules, request hidden prompts, "
-        "or include common prompt-injection patterns will be blocked before reaching the workflow."
+        "or include common prompt-injection patterns are blocked at the start of the workflow, before any retrieval or model call."
     )
 
 
@@ -210,6 +288,11 @@ with st.sidebar:
     st.title("Healthcare Agent Copilot")
     st.header("Settings")
     k = st.slider("Top-K retrieval chunks", min_value=3, max_value=10, value=5, step=1)
+    plan_mode = st.selectbox(
+        "Planner",
+        options=["skip", "parallel", "serial"],
+        help="skip: no plan (fastest); parallel: plan while researching; serial: plan first.",
+    )
 
     st.markdown("---")
     show_trace = st.checkbox("Show agent trace", value=True)
@@ -272,23 +355,24 @@ if run_clicked:
         st.warning("Please enter a question.")
         st.session_state["status"] = "Ready"
     else:
-        # Prompt injection protection (block before workflow)
-        if is_prompt_injection(q):
-            st.session_state["last_result"] = None
-            st.session_state["status"] = "Blocked"
-            st.session_state["last_error"] = "Prompt injection detected. Query blocked."
-        else:
-            try:
-                with st.spinner("Running workflow..."):
-                    result = app.invoke({"question": q, "k": k})
+        try:
+            result = run_streaming({"question": q, "k": k, "plan_mode": plan_mode})
 
+            # The workflow's guard node screens every request (once) for prompt injection
+            if result.get("blocked"):
+                st.session_state["last_result"] = None
+                st.session_state["status"] = "Blocked"
+                st.session_state["last_error"] = (
+                    f"Prompt injection detected (rule: \"{result.get('guard_rule', '')}\"). Query blocked."
+                )
+            else:
                 st.session_state["last_result"] = result
                 st.session_state["status"] = "Ready"
 
-            except Exception as e:
-                st.session_state["last_error"] = f"{type(e).__name__}: {e}"
-                st.session_state["last_result"] = None
-                st.session_state["status"] = "Error"
+        except Exception as e:
+            st.session_state["last_error"] = f"{type(e).__name__}: {e}"
+            st.session_state["last_result"] = None
+            st.session_state["status"] = "Error"
 
 
 
@@ -300,11 +384,17 @@ status = st.session_state.get("status", "Ready")
 verified = False
 attempts = 0
 topk_used = k
+run_metrics = summarize([])
 
 if result:
     verified = bool(result.get("verified", False))
     attempts = int(result.get("attempts", 0) or 0)
     topk_used = int(result.get("k", k) or k)
+    run_metrics = summarize(result.get("metrics", []))
+
+latency_text = f"{run_metrics['wall_seconds']:.1f}s" if result else "-"
+tokens_used = run_metrics.get("prompt_tokens", 0) + run_metrics.get("completion_tokens", 0)
+tokens_text = f"{tokens_used:,} ({run_metrics.get('llm_calls', 0)} calls)" if result else "-"
 
 verified_text = "Yes" if verified else "No"
 verified_color = "#22c55e" if verified else "#ef4444"
@@ -328,6 +418,14 @@ st.markdown(
     <div class="metric-label">Top-K</div>
     <div class="metric-value">{topk_used}</div>
   </div>
+  <div class="metric-card">
+    <div class="metric-label">Latency</div>
+    <div class="metric-value">{latency_text}</div>
+  </div>
+  <div class="metric-card">
+    <div class="metric-label">Tokens</div>
+    <div class="metric-value">{tokens_text}</div>
+  </div>
   <div class="metric-card">
     <div class="metric-label">Security</div>
     <div class="metric-value" style="color:{security_color}">{security_text}</div>
@@ -355,8 +453,14 @@ with tab_answer:
     if not result:
         st.info("Run a query to see an answer.")
     else:
+        if result.get("cache_hit"):
+            st.caption(f"Served from answer cache ({result['cache_hit']} match).")
+        rejected_drafts = st.session_state.get("rejected_drafts", 0)
+        if rejected_drafts:
+            st.caption(f"{rejected_drafts} earlier draft(s) were rejected by the verifier before this answer.")
         final_answer = normalize_answer_sections(result.get("final_answer", "") or "")
         st.markdown(final_answer)
+        render_grounding(result.get("grounding") or {})
 
     st.markdown("</div>", unsafe_allow_html=True)
 
@@ -389,6 +493,29 @@ with tab_trace:
             draft = result.get("draft", "") or ""
             st.code(draft if draft.strip() else "(empty)")
 
+            st.subheader("Node timings")
+            spans = result.get("metrics", []) or []
+            if spans:
+                st.table([
+                    {
+                        "node": s["node"],
+                        "seconds": round(s.get("seconds", 0.0), 3),
+                        "llm calls": s.get("llm_calls", 0),
+                        "tokens": s.get("prompt_tokens", 0) + s.get("completion_tokens", 0),
+                        "retrieval queries": s.get("retrieval_queries", 0),
+                        "cache hits": s.get("embedding_cache_hits", 0) + s.get("answer_cache_hits", 0),
+                    }
+                    for s in spans
+                ])
+            else:
+                st.caption("No node metrics recorded.")
+
+            failures = result.get("failures", []) or []
+            if failures:
+                st.subheader("Verifier findings")
+                for f in failures:
+                    st.write(f"- `{f['code']}` ({f['repair']}): {f['message']}")
+
             failure_reason = result.get("failure_reason", "") or ""
             if failure_reason.strip():
                 st.subheader("Failure reason")
@@ -0,0 +1,219 @@
+"""
+Offline benchmark suite for retrieval (Chroma and NumPy vector backends),
+research, the full workflow, indexing, the injection guard and the verifier,
+against the PDFs in data/.
+
+By default it runs with the deterministic fake chat model and local hashing
+embeddings (no network). Every run indexes into a fresh temporary Chroma
+directory, whatever the provider or CHROMA_DIR, so .chroma is never touched:
+
+    python -m eval.benchmark
+    python -m eval.benchmark --rounds 20 --llm-latency 0.2 --json bench.json
+    python -m eval.benchmark --provider openai   # real providers (paid embeddings)
+
+Timings are reported pytest-benchmark style (min/max/mean/stddev/median/ops).
+"""
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import time
+
+QUESTIONS = [
+    "How should a hospital adopt an AI copilot for operations?",
+    "What governance and safety guardrails are recommended for AI in hospitals?",
+    "What privacy-preserving techniques are recommended before using AI on patient data?",
+]
+
+
+def bench(name: str, fn, rounds: int, warmup: int = 1, items: int = 1, setup=None) -> dict:
+    # setup runs untimed before every call, e.g. to drop memoized results
+    for _ in range(warmup):
+        if setup:
+            setup()
+        fn()
+
+    times = []
+    for _ in range(rounds):
+        if setup:
+            setup()
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+
+    mean = statistics.fmean(times)
+    return {
+        "name": name,
+        "rounds": rounds,
+        "min": min(times),
+        "max": max(times),
+        "mean": mean,
+        "stddev": statistics.stdev(times) if len(times) > 1 else 0.0,
+        "median": statistics.median(times),
+        "ops": items / mean if mean else float("inf"),
+    }
+
+
+def print_table(results: list):
+    header = f"{'name':<28}{'min (ms)':>12}{'mean (ms)':>12}{'median (ms)':>13}{'stddev':>10}{'ops/s':>12}{'rounds':>8}"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        print(
+            f"{r['name']:<28}{r['min'] * 1e3:>12.3f}{r['mean'] * 1e3:>12.3f}{r['median'] * 1e3:>13.3f}"
+            f"{r['stddev'] * 1e3:>10.3f}{r['ops']:>12.1f}{r['rounds']:>8}"
+        )
+
+
+def configure(args):
+    # Providers and the Chroma location are read at import time, so this
+    # must run before any agents/retrieval/graph module is imported.
+    if args.provider == "fake":
+        os.environ["LLM_PROVIDER"] = "fake"
+        os.environ["EMBEDDINGS_PROVIDER"] = "hashing"
+        os.environ["FAKE_LLM_LATENCY"] = str(args.llm_latency)
+        os.environ["FAKE_LLM_TOKEN_LATENCY"] = str(args.token_latency)
+    # always a fresh index: main() runs a full re-index, which must never
+    # reset the real .chroma (or an exported CHROMA_DIR)
+    os.environ["CHROMA_DIR"] = tempfile.mkdtemp(prefix="bench_chroma_")
+    # time the model path, not completions replayed from an earlier run
+    os.environ.setdefault("COMPLETION_CACHE", "off")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark suite.")
+    parser.add_argument("--provider", choices=["fake", "openai"], default="fake")
+    parser.add_argument("--data-dir", default="data")
+    parser.add_argument("--rounds", type=int, default=10)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="fake model latency per call (s)")
+    parser.add_argument("--token-latency", type=float, default=0.0, help="fake model latency per token (s)")
+    parser.add_argument("--json", default="", help="write results to this file")
+    args = parser.parse_args()
+    configure(args)
+
+    from agents.researcher import research_queries, run_researcher
+    from agents.verifier import run_verifier
+    from agents.writer import run_writer
+    from graph.workflow import build_graph
+    from retrieval.numpy_index import NumpyIndex
+    from retrieval.vector_store import index_documents, retrieve, store
+    from utils.security import injection_guard
+
+    results = []
+
+    # Indexing throughput: a full re-embed of data/ (single round, it's the slow one).
+    t0 = time.perf_counter()
+    summary = index_documents(args.data_dir, full=True)
+    seconds = time.perf_counter() - t0
+    chunks = summary["chunks_added"]
+    results.append({
+        "name": "index_documents(full)",
+        "rounds": 1,
+        "min": seconds, "max": seconds, "mean": seconds, "stddev": 0.0, "median": seconds,
+        "ops": chunks / seconds if seconds else float("inf"),
+    })
+    print(f"indexed {chunks} chunks from {len(summary['files'])} files in {seconds:.2f}s "
+          f"({chunks / seconds:.1f} chunks/s) into {store.persist_dir}")
+
+    # Injection guard over large pasted inputs: time per scan should grow
+    # linearly with the input (ops/s here is MB/s).
+    for size_kb in (10, 100, 1000):
+        pasted = (" ".join(QUESTIONS) + " ") * (size_kb * 1024 // (len(" ".join(QUESTIONS)) + 1))
+        results.append(bench(
+            f"injection_guard ({size_kb} KB)",
+            lambda: injection_guard.scan(pasted),
+            args.rounds,
+            items=len(pasted) / 1e6,
+        ))
+
+    # Vector backends on the same query vectors: one query, and a batch of all questions.
+    vectors = store.query_cache().embed_queries(QUESTIONS)
+    for kind in ("chroma", "numpy"):
+        backend = store.backend(args.data_dir, kind=kind)
+        results.append(bench(f"search {kind} (1 query)", lambda: backend.search(vectors[:1], 30), args.rounds * 10))
+        results.append(bench(
+            f"search {kind} ({len(vectors)} queries)",
+            lambda: backend.search(vectors, 30),
+            args.rounds * 10,
+            items=len(vectors),
+        ))
+    results.append(bench("numpy index cold open", lambda: NumpyIndex.load(store.persist_dir), args.rounds))
+
+    # Quantized numpy modes: memory and recall@k against what retrieval
+    # returns today (Chroma) over all research queries of the questions.
+    queries = [rq for question in QUESTIONS for rq in research_queries(question)]
+    query_vectors = store.query_cache().embed_queries(queries)
+    reference = [
+        {h["chunk_id"] for h in hits[:args.k]}
+        for hits in store.backend(args.data_dir, kind="chroma").search(query_vectors, args.k)
+    ]
+    index = store.backend(args.data_dir, kind="numpy")
+    memory = index.memory_bytes()
+    quantization = []
+    for mode in ("none", "int8", "binary"):
+        found = index.search(query_vectors, args.k, quantization=mode)
+        recall = statistics.fmean(
+            len(ref & {h["chunk_id"] for h in hits}) / max(1, len(ref)) for ref, hits in zip(reference, found)
+        )
+        quantization.append({
+            "mode": mode,
+            "bytes": memory[mode],
+            "savings": memory["none"] / memory[mode] if memory[mode] else 0.0,
+            f"recall@{args.k}": recall,
+        })
+        results.append(bench(
+            f"search numpy {mode} ({len(queries)} q)",
+            lambda: index.search(query_vectors, args.k, quantization=mode),
+            args.rounds * 10,
+            items=len(queries),
+        ))
+    store.close()
+
+    # the per-query result memo would turn every round after the warm-up
+    # into a dictionary lookup; clear it so each round searches
+    q = QUESTIONS[0]
+    results.append(bench("retrieve", lambda: retrieve(q, k=args.k), args.rounds, setup=store.memo_clear))
+    results.append(bench(
+        "run_researcher", lambda: run_researcher(q, k=args.k), args.rounds, setup=store.memo_clear
+    ))
+
+    research = run_researcher(q, k=args.k)
+    drafts = [run_writer(question, research) for question in QUESTIONS]
+    batch = (drafts * 34)[:100]
+    results.append(bench(
+        "run_verifier (x100)",
+        lambda: [run_verifier(d, research) for d in batch],
+        args.rounds,
+        items=100,
+    ))
+
+    app = build_graph(cache=False)
+    results.append(bench(
+        "build_graph().invoke",
+        lambda: app.invoke({"question": q, "k": args.k}),
+        max(1, args.rounds // 2),
+        setup=store.memo_clear,
+    ))
+
+    cached = build_graph(cache=True)
+    results.append(bench(
+        "build_graph().invoke cached",
+        lambda: cached.invoke({"question": q, "k": args.k}),
+        args.rounds,
+    ))
+
+    print()
+    print_table(results)
+    print()
+    print(f"{'quantization':<14}{'vectors (MB)':>14}{'savings':>10}{f'recall@{args.k}':>12}")
+    for q in quantization:
+        print(f"{q['mode']:<14}{q['bytes'] / 2**20:>14.3f}{q['savings']:>9.1f}x{q[f'recall@{args.k}']:>12.3f}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"provider": args.provider, "results": results, "quantization": quantization}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
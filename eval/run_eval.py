@@ -1,22 +1,206 @@
+import argparse
+import hashlib
 import json
+import math
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+
 from graph.workflow import build_graph
+from retrieval.vector_store import resolve_research
+from utils.completion_cache import completion_cache
+from utils.llm import llm_priority
+from utils.metrics import summarize
+
+QUERIES_FILE = "eval/sample_queries.json"
+RESULTS_FILE = "eval/results.jsonl"
+REPORT_FILE = "eval/report.json"
+
+
+def load_queries(path: str) -> list:
+    data = json.loads(Path(path).read_text(encoding="utf-8"))
+    if isinstance(data, dict):
+        data = data.get("queries") or data.get("samples") or data.get("questions") or []
+
+    queries = []
+    for item in data:
+        q = item if isinstance(item, str) else (item.get("question") or item.get("q") or "")
+        if q.strip():
+            queries.append(q.strip())
+    return queries
+
+
+def query_id(index: int, question: str) -> str:
+    return f"{index}-{hashlib.sha1(question.encode('utf-8')).hexdigest()[:10]}"
+
+
+def load_done(path: str) -> dict:
+    # later rows for the same id replace earlier ones, so a retried question
+    # supersedes its failed attempt
+    done = {}
+    if Path(path).exists():
+        for line in Path(path).read_text(encoding="utf-8").splitlines():
+            if line.strip():
+                row = json.loads(line)
+                done[row["id"]] = row
+    return done
+
+
+def run_one(app, qid: str, question: str, k: int) -> dict:
+    start = time.perf_counter()
+    error = None
+    result = {}
+    try:
+        # eval traffic yields to interactive requests at the LLM scheduler
+        with llm_priority("batch"):
+            result = app.invoke({"question": question, "k": k})
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+
+    # per-node wall time, LLM calls and tokens from the workflow's own spans
+    run_metrics = summarize(result.get("metrics", []))
+    research = result.get("research", []) or []
+    scores = [r["score"] for r in research if r.get("score") is not None]
+    return {
+        "id": qid,
+        "question": question,
+        "k": k,
+        "error": error,
+        "seconds": round(time.perf_counter() - start, 4),
+        "verified": bool(result.get("verified", False)),
+        "attempts": int(result.get("attempts", 0) or 0),
+        "blocked": bool(result.get("blocked", False)),
+        "cache_hit": result.get("cache_hit"),
+        "node_seconds": {n: round(s, 4) for n, s in run_metrics["node_seconds"].items()},
+        "llm_calls": run_metrics.get("llm_calls", 0),
+        "prompt_tokens": run_metrics.get("prompt_tokens", 0),
+        "completion_tokens": run_metrics.get("completion_tokens", 0),
+        "retries": run_metrics.get("retries", 0),
+        "embedding_calls": run_metrics.get("embedding_calls", 0),
+        "research_chunks": len(research),
+        "research_sources": len({r.get("source") for r in resolve_research(research)}),
+        "best_score": min(scores) if scores else None,
+        "mean_score": sum(scores) / len(scores) if scores else None,
+        "final_answer": result.get("final_answer", ""),
+    }
+
+
+def percentile(values: list, p: float):
+    if not values:
+        return None
+    ordered = sorted(values)
+    # nearest-rank
+    idx = min(len(ordered) - 1, max(0, math.ceil(p / 100 * len(ordered)) - 1))
+    return round(ordered[idx], 4)
+
+
+def latency_summary(values: list) -> dict:
+    return {
+        "count": len(values),
+        "p50": percentile(values, 50),
+        "p90": percentile(values, 90),
+        "p99": percentile(values, 99),
+        "max": round(max(values), 4) if values else None,
+    }
+
+
+def build_report(rows: list) -> dict:
+    ok = [r for r in rows if not r["error"]]
+    per_node = defaultdict(list)
+    for r in ok:
+        for node, seconds in r["node_seconds"].items():
+            per_node[node].append(seconds)
+
+    best = [r["best_score"] for r in ok if r["best_score"] is not None]
+    return {
+        "questions": len(rows),
+        "errors": len(rows) - len(ok),
+        "verifier_pass_rate": sum(r["verified"] for r in ok) / len(ok) if ok else 0.0,
+        "attempts": dict(sorted(Counter(r["attempts"] for r in ok).items())),
+        "cache_hits": sum(1 for r in ok if r["cache_hit"]),
+        "latency": latency_summary([r["seconds"] for r in ok]),
+        "node_latency": {node: latency_summary(v) for node, v in sorted(per_node.items())},
+        "llm_calls": sum(r["llm_calls"] for r in ok),
+        "prompt_tokens": sum(r["prompt_tokens"] for r in ok),
+        "completion_tokens": sum(r["completion_tokens"] for r in ok),
+        "embedding_calls": sum(r.get("embedding_calls", 0) for r in ok),
+        "retries": sum(r.get("retries", 0) for r in ok),
+        "retrieval": {
+            "mean_chunks": sum(r["research_chunks"] for r in ok) / len(ok) if ok else 0.0,
+            "mean_sources": sum(r["research_sources"] for r in ok) / len(ok) if ok else 0.0,
+            "no_hits": sum(1 for r in ok if not r["research_chunks"] and not r["blocked"]),
+            "best_score_p50": percentile(best, 50),
+        },
+    }
 
 
 def main():
-    app = build_graph()
+    parser = argparse.ArgumentParser(description="Run the evaluation queries through the workflow.")
+    parser.add_argument("--queries", default=QUERIES_FILE)
+    parser.add_argument("--results", default=RESULTS_FILE, help="JSONL checkpoint; finished queries are skipped")
+    parser.add_argument("--report", default=REPORT_FILE)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--fresh", action="store_true", help="ignore and overwrite existing results")
+    parser.add_argument("--no-cache", action="store_true", help="bypass the answer cache")
+    parser.add_argument("--no-llm-cache", action="store_true", help="bypass the completion cache")
+    parser.add_argument("--show-answers", action="store_true")
+    args = parser.parse_args()
+
+    app = build_graph(cache=not args.no_cache)
+    if args.no_llm_cache:
+        completion_cache.enabled = False
+    queries = [(query_id(i, q), q) for i, q in enumerate(load_queries(args.queries), 1)]
+
+    if args.fresh and Path(args.results).exists():
+        Path(args.results).unlink()
+    done = load_done(args.results)
+    # failed rows (429s, timeouts, ...) are run again; only successes count as done
+    todo = [(qid, q) for qid, q in queries if qid not in done or done[qid]["error"] is not None]
+    print(f"{len(queries)} queries, {len(queries) - len(todo)} already done, running {len(todo)} "
+          f"with {args.workers} workers")
 
-    with open("eval/sample_queries.json", "r", encoding="utf-8") as f:
-        queries = json.load(f)
+    Path(args.results).parent.mkdir(parents=True, exist_ok=True)
+    with open(args.results, "a", encoding="utf-8") as out, ThreadPoolExecutor(args.workers) as pool:
+        # submit in a bounded window, so Ctrl-C leaves at most a few queued
+        # questions to cancel instead of the whole run spending API calls
+        queue = iter(todo)
+        window = max(1, args.workers * 2)
+        pending = set()
+        n = 0
+        try:
+            while True:
+                for qid, q in queue:
+                    pending.add(pool.submit(run_one, app, qid, q, args.k))
+                    if len(pending) >= window:
+                        break
+                if not pending:
+                    break
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for fut in finished:
+                    row = fut.result()
+                    out.write(json.dumps(row) + "\n")
+                    out.flush()
+                    done[row["id"]] = row
 
-    for i, q in enumerate(queries, 1):
-        result = app.invoke({"question": q})
-        answer = result.get("final_answer", "")
+                    n += 1
+                    status = "ERROR" if row["error"] else ("PASS" if row["verified"] else "FAIL")
+                    print(f"[{n}/{len(todo)}] {status} {row['seconds']:.2f}s {row['question'][:70]}")
+                    if args.show_answers:
+                        print("-" * 80)
+                        print(row["error"] or row["final_answer"][:1200])
+                        print("=" * 80)
+        except KeyboardInterrupt:
+            pool.shutdown(wait=False, cancel_futures=True)
+            print(f"interrupted after {n}/{len(todo)}; rerun to resume from {args.results}")
+            raise
 
-        print("\n" + "=" * 80)
-        print(f"QUERY {i}: {q}")
-        print("-" * 80)
-        print(answer[:1200])  
-        print("\n")
+    ids = {qid for qid, _ in queries}
+    report = build_report([row for qid, row in done.items() if qid in ids])
+    Path(args.report).write_text(json.dumps(report, indent=2), encoding="utf-8")
+    print(json.dumps(report, indent=2))
+    print("completion cache:", json.dumps(completion_cache.stats()))
 
 
 if __name__ == "__main__":
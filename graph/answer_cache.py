@@ -0,0 +1,211 @@
+import asyncio
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Optional
+
+import numpy as np
+
+from graph.events import stream_events
+from retrieval.vector_store import store
+from utils.metrics import record
+from utils.security import injection_guard
+
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "3600"))
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "256"))
+
+
+# Keys describing one particular run, never replayed from the cache.
+PER_REQUEST_KEYS = ("cache_hit", "metrics", "trace_id")
+
+
+def _normalize(question: str) -> str:
+    return " ".join(question.lower().split())
+
+
+class AnswerCache:
+    """
+    Verified answers keyed by (question, k, index version).
+    Exact matches are a dict lookup; near-identical questions are matched by
+    cosine similarity of their query embeddings above `threshold`.
+    Entries expire after `ttl` seconds; the oldest are evicted past `max_entries`.
+    """
+
+    def __init__(
+        self,
+        threshold: float = ANSWER_CACHE_THRESHOLD,
+        ttl: float = ANSWER_CACHE_TTL,
+        max_entries: int = ANSWER_CACHE_SIZE,
+    ):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[tuple, dict]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _embed(self, question: str) -> np.ndarray:
+        # Goes through the query-embedding cache, so the researcher's
+        # first query for the same question is then a cache hit.
+        vector = np.asarray(store.query_cache().embed_query(question), dtype=np.float32)
+        return vector / (np.linalg.norm(vector) or 1.0)
+
+    def _expire(self, now: float):
+        for key in [key for key, e in self._entries.items() if now - e["created"] > self.ttl]:
+            del self._entries[key]
+            self.evictions += 1
+
+    def lookup(self, question: str, k: int, version: str) -> Optional[dict]:
+        key = (_normalize(question), k, version)
+        with self._lock:
+            self._expire(time.time())
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.exact_hits += 1
+                return dict(entry["result"], cache_hit="exact")
+            candidates = [e for e in self._entries.values() if e["k"] == k and e["version"] == version]
+
+        if self.threshold < 1.0 and candidates:
+            vector = self._embed(question)
+            sims = np.stack([e["vector"] for e in candidates]) @ vector
+            best = int(np.argmax(sims))
+            if sims[best] >= self.threshold:
+                with self._lock:
+                    self.semantic_hits += 1
+                return dict(candidates[best]["result"], cache_hit="semantic")
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, question: str, k: int, version: str, result: dict):
+        # Only verified, unblocked answers are worth serving again.
+        if not result.get("verified") or result.get("blocked"):
+            return
+
+        entry = {
+            "k": k,
+            "version": version,
+            "vector": self._embed(question) if self.threshold < 1.0 else None,
+            "result": {key: value for key, value in result.items() if key not in PER_REQUEST_KEYS},
+            "created": time.time(),
+        }
+        key = (_normalize(question), k, version)
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            hits = self.exact_hits + self.semantic_hits
+            total = hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "exact_hits": self.exact_hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": hits / total if total else 0.0,
+            }
+
+
+answer_cache = AnswerCache()
+
+
+class CachedGraph:
+    """Compiled LangGraph app with the answer cache in front of invoke(), ainvoke() and stream_events()."""
+
+    def __init__(self, app, cache: AnswerCache = answer_cache):
+        self.app = app
+        self.cache = cache
+
+    def _screen(self, state: dict):
+        # Guard before the cache, so an injection attempt can't be answered
+        # by a cached near-duplicate; the guard node reuses this verdict.
+        rule = injection_guard.scan(state.get("question", "")) or ""
+        return dict(state, guard_rule=rule), bool(rule)
+
+    def _key(self, state: dict):
+        return state.get("question", ""), state.get("k", 5), store.version()
+
+    def _lookup(self, key) -> Optional[dict]:
+        start = time.time()
+        cached = self.cache.lookup(*key)
+        if cached is None:
+            record("answer_cache_misses")
+            return None
+
+        record("answer_cache_hits")
+        span = {
+            "node": "answer_cache",
+            "trace_id": uuid.uuid4().hex,
+            "span_id": uuid.uuid4().hex[:16],
+            "start": start,
+            "seconds": round(time.time() - start, 6),
+            "answer_cache_hits": 1,
+        }
+        return dict(cached, metrics=[span], trace_id=span["trace_id"])
+
+    def invoke(self, state: dict, *args, **kwargs):
+        state, blocked = self._screen(state)
+        if blocked:
+            return self.app.invoke(state, *args, **kwargs)
+
+        key = self._key(state)
+        cached = self._lookup(key)
+        if cached is not None:
+            return cached
+
+        result = self.app.invoke(state, *args, **kwargs)
+        self.cache.put(*key, result)
+        return result
+
+    async def ainvoke(self, state: dict, *args, **kwargs):
+        state, blocked = self._screen(state)
+        if blocked:
+            return await self.app.ainvoke(state, *args, **kwargs)
+
+        key = self._key(state)
+        # a semantic lookup may embed the question, so keep it off the loop
+        cached = await asyncio.to_thread(self._lookup, key)
+        if cached is not None:
+            return cached
+
+        result = await self.app.ainvoke(state, *args, **kwargs)
+        await asyncio.to_thread(self.cache.put, *key, result)
+        return result
+
+    def stream_events(self, state: dict):
+        state, blocked = self._screen(state)
+        if blocked:
+            yield from stream_events(self.app, state)
+            return
+
+        key = self._key(state)
+        cached = self._lookup(key)
+        if cached is not None:
+            yield {"type": "final", "state": cached}
+            return
+
+        for event in stream_events(self.app, state):
+            if event["type"] == "final":
+                self.cache.put(*key, event["state"])
+            yield event
+
+    def __getattr__(self, name):
+        return getattr(self.app, name)
@@ -0,0 +1,37 @@
+TOKEN_NODES = ("writer",)
+
+
+def stream_events(app, state: dict):
+    """
+    Run a compiled graph and yield events as they happen:
+      {"type": "node", "node": name, "update": {...}}  after each node finishes
+      {"type": "token", "node": "writer", "text": "..."}  for each writer token
+      {"type": "rejected", "attempts": n, "failures": [...]}  when the verifier rejects a draft
+      {"type": "final", "state": {...}}  once, with the final state
+    """
+    final = None
+    modes = ["updates", "messages", "values"]
+
+    for mode, payload in app.stream(state, stream_mode=modes):
+        if mode == "messages":
+            chunk, metadata = payload
+            node = metadata.get("langgraph_node")
+            text = getattr(chunk, "content", "")
+            if node in TOKEN_NODES and isinstance(text, str) and text:
+                yield {"type": "token", "node": node, "text": text}
+
+        elif mode == "updates":
+            for node, update in payload.items():
+                update = update or {}
+                yield {"type": "node", "node": node, "update": update}
+                if node == "verifier" and not update.get("verified", False):
+                    yield {
+                        "type": "rejected",
+                        "attempts": update.get("attempts", 0),
+                        "failures": update.get("failures", []),
+                    }
+
+        elif mode == "values":
+            final = payload
+
+    yield {"type": "final", "state": final or {}}
@@ -1,39 +1,77 @@
-from typing import TypedDict, List
+import asyncio
+import operator
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Annotated, TypedDict, List
 from langgraph.graph import StateGraph, END
 
-from agents.planner import run_planner
-from agents.researcher import run_researcher
-from agents.writer import run_writer
-from agents.verifier import run_verifier
+from agents.planner import arun_planner, run_planner
+from agents.researcher import arun_researcher, run_researcher, warm_research_queries, warm_static_queries
+from agents.writer import arun_writer, run_writer
+from agents.repair import repair_draft
+from agents.verifier import needs_research, verify_draft
 
-from utils.security import is_prompt_injection
+from graph.answer_cache import CachedGraph
+from utils.llm import llm_priority
+from utils.metrics import instrument, record
+from utils.security import injection_guard
 
 
 class AgentState(TypedDict, total=False):
     question: str
     k: int
+    plan_mode: str
 
     plan: str
     research: List[dict]
     draft: str
 
     verified: bool
+    failures: List[dict]
+    grounding: dict
     attempts: int
     final_answer: str
     failure_reason: str
 
+    # injection guard verdict: the rule that fired, "" when clean; set once
+    # per request (by CachedGraph before the cache lookup, else by guard)
+    guard_rule: str
     blocked: bool
     block_reason: str
 
+    cache_hit: str
+
+    # one span per node run (wall time, LLM calls, tokens, retrieval/cache
+    # counters); parallel branches append, see utils.metrics.instrument
+    trace_id: str
+    metrics: Annotated[List[dict], operator.add]
+
 
 MAX_ATTEMPTS = 2
 
+# How the planner relates to research (overridable per request via state["plan_mode"]):
+#   "skip":     no planning call at all (default)
+#   "parallel": planner and researcher run in the same step
+#   "serial":   planner runs before researcher
+# The plan is only shown in the trace. In "parallel" the writer still waits
+# for the whole step, so the planner call stays on the critical path whenever
+# it outlasts retrieval; only "skip" takes it off.
+PLAN_MODE = os.getenv("PLAN_MODE", "skip")
+PLAN_MODES = ("parallel", "serial", "skip")
 
-def planner(state: AgentState):
-    question = state.get("question", "")
+# Questions in flight at once in run_batch()/arun_batch().
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
 
-    if is_prompt_injection(question):
+
+def guard(state: AgentState):
+    rule = state.get("guard_rule")
+    if rule is None:
+        rule = injection_guard.scan(state.get("question", "")) or ""
+
+    if rule:
+        record("guard_blocks")
         return {
+            "guard_rule": rule,
             "blocked": True,
             "block_reason": "prompt_injection",
             "verified": False,
@@ -44,8 +82,12 @@ def planner(state: AgentState):
             ),
         }
 
-    plan = run_planner(question)
-    return {"plan": plan, "attempts": 0, "blocked": False}
+    return {"attempts": 0, "blocked": False, "guard_rule": ""}
+
+
+def planner(state: AgentState):
+    plan = run_planner(state.get("question", ""))
+    return {"plan": plan}
 
 
 def researcher(state: AgentState):
@@ -59,14 +101,43 @@ def writer(state: AgentState):
     return {"draft": draft}
 
 
+# Async variants of the I/O-bound nodes, used by abuild_graph().
+async def aplanner(state: AgentState):
+    plan = await arun_planner(state.get("question", ""))
+    return {"plan": plan}
+
+
+async def aresearcher(state: AgentState):
+    k = state.get("k", 5)
+    docs = await arun_researcher(state.get("question", ""), k=k)
+    return {"research": docs}
+
+
+async def awriter(state: AgentState):
+    draft = await arun_writer(state.get("question", ""), state.get("research", []))
+    return {"draft": draft}
+
+
 def verifier(state: AgentState):
-    verified = run_verifier(state.get("draft", ""), state.get("research", []))
+    result = verify_draft(state.get("draft", ""), state.get("research", []))
+    verified = result["verified"]
 
     attempts = state.get("attempts", 0) + 1
-    update: AgentState = {"verified": verified, "attempts": attempts}
-
+    update: AgentState = {
+        "verified": verified,
+        "attempts": attempts,
+        "failures": result["failures"],
+        "grounding": result["grounding"],
+    }
+
+    # Only insufficient evidence goes back to research (with a bigger k);
+    # format problems are patched by the repair node.
     if not verified and attempts < MAX_ATTEMPTS:
-        update["k"] = min(state.get("k", 5) + 2, 10)
+        if needs_research(result["failures"]):
+            update["k"] = min(state.get("k", 5) + 2, 10)
+            record("retries")
+        else:
+            record("repairs")
 
     if not verified and attempts >= MAX_ATTEMPTS:
         update["failure_reason"] = "Could not produce a citation-grounded answer after retries."
@@ -78,6 +149,16 @@ def verifier(state: AgentState):
     return update
 
 
+def repair(state: AgentState):
+    draft = repair_draft(
+        state.get("question", ""),
+        state.get("draft", ""),
+        state.get("failures", []),
+        state.get("research", []),
+    )
+    return {"draft": draft}
+
+
 def deliver(state: AgentState):
     if state.get("final_answer"):
         return {"final_answer": state["final_answer"]}
@@ -85,54 +166,182 @@ def deliver(state: AgentState):
     return {"final_answer": state.get("draft", "")}
 
 
-def route_after_planner(state: AgentState) -> str:
+def plan_mode(state: AgentState) -> str:
+    mode = state.get("plan_mode") or PLAN_MODE
+    if mode not in PLAN_MODES:
+        raise ValueError(f"Unknown plan_mode: {mode}")
+    return mode
+
+
+def route_after_guard(state: AgentState):
     if state.get("blocked", False):
         return "deliver"
+
+    mode = plan_mode(state)
+    if mode == "parallel":
+        # fan out; writer runs once both branches of this step have finished
+        return ["planner", "researcher"]
+    if mode == "serial":
+        return "planner"
     return "researcher"
 
 
+def route_after_planner(state: AgentState) -> str:
+    if plan_mode(state) == "serial":
+        return "researcher"
+    # parallel: the researcher branch continues to the writer
+    return END
+
+
 def should_retry(state: AgentState) -> str:
     if state.get("verified", False):
         return "deliver"
 
     if state.get("attempts", 0) < MAX_ATTEMPTS:
-        return "researcher"
+        if needs_research(state.get("failures", [])):
+            return "researcher"
+        return "repair"
 
     return "deliver"
 
 
-def build_graph():
+def _compile(planner_node, researcher_node, writer_node, cache: bool):
+    # Embed the constant research queries once at startup instead of per question.
+    warm_static_queries()
+
     graph = StateGraph(AgentState)
 
-    graph.add_node("planner", planner)
-    graph.add_node("researcher", researcher)
-    graph.add_node("writer", writer)
-    graph.add_node("verifier", verifier)
-    graph.add_node("deliver", deliver)
+    graph.add_node("guard", instrument("guard", guard))
+    graph.add_node("planner", instrument("planner", planner_node))
+    graph.add_node("researcher", instrument("researcher", researcher_node))
+    graph.add_node("writer", instrument("writer", writer_node))
+    graph.add_node("verifier", instrument("verifier", verifier))
+    graph.add_node("repair", instrument("repair", repair))
+    graph.add_node("deliver", instrument("deliver", deliver))
+
+    graph.set_entry_point("guard")
 
-    graph.set_entry_point("planner")
+    graph.add_conditional_edges(
+        "guard",
+        route_after_guard,
+        {
+            "planner": "planner",
+            "researcher": "researcher",
+            "deliver": "deliver",
+        },
+    )
 
     graph.add_conditional_edges(
         "planner",
         route_after_planner,
         {
             "researcher": "researcher",
-            "deliver": "deliver",
+            END: END,
         },
     )
 
     graph.add_edge("researcher", "writer")
     graph.add_edge("writer", "verifier")
+    graph.add_edge("repair", "verifier")
 
     graph.add_conditional_edges(
         "verifier",
         should_retry,
         {
             "researcher": "researcher",
+            "repair": "repair",
             "deliver": "deliver",
         },
     )
 
     graph.add_edge("deliver", END)
 
-    return graph.compile()
+    app = graph.compile()
+    # Verified answers are served from the answer cache for repeated questions.
+    return CachedGraph(app) if cache else app
+
+
+def build_graph(cache: bool = True):
+    return _compile(planner, researcher, writer, cache)
+
+
+def abuild_graph(cache: bool = True):
+    """
+    Same workflow with async planner/researcher/writer nodes, for ainvoke().
+    Many questions can share one event loop; calls to each upstream are
+    bounded by utils.limits.
+    """
+    return _compile(aplanner, aresearcher, awriter, cache)
+
+
+def _prepare_batch(questions: list) -> list:
+    # identical questions run once; all their retrieval queries are embedded
+    # in one batched request up front
+    unique = list(dict.fromkeys(q.strip() for q in questions if q and q.strip()))
+    warm_research_queries(unique)
+    return unique
+
+
+def _batch_error(question: str, exc: Exception) -> dict:
+    # one failed question doesn't abort the batch
+    return {"question": question, "error": f"{type(exc).__name__}: {exc}"}
+
+
+def _invoke_batch(app, state: dict):
+    # thread-pool workers don't inherit the caller's context: set it here
+    try:
+        with llm_priority("batch"):
+            return app.invoke(state)
+    except Exception as e:
+        return _batch_error(state["question"], e)
+
+
+def run_batch(questions: list, k: int = 5, concurrency: int = BATCH_CONCURRENCY, plan_mode: str = "skip"):
+    """
+    Run many questions through one compiled workflow, yielding
+    (question, result) as each finishes. Duplicates are answered once;
+    retrieval results are shared across questions through the store's
+    result memo and verified answers through the answer cache. Planning is
+    skipped by default, since the plan only feeds the trace. A question
+    that raises yields {"question": ..., "error": "..."} instead.
+    """
+    unique = _prepare_batch(questions)
+    app = build_graph()
+    pool = ThreadPoolExecutor(max_workers=max(1, concurrency))
+    try:
+        futures = {
+            pool.submit(_invoke_batch, app, {"question": q, "k": k, "plan_mode": plan_mode}): q
+            for q in unique
+        }
+        for future in as_completed(futures):
+            yield futures[future], future.result()
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+async def arun_batch(questions: list, k: int = 5, concurrency: int = BATCH_CONCURRENCY, plan_mode: str = "skip"):
+    """
+    Async run_batch on one event loop: writer, embedding and Chroma calls
+    are bounded by utils.limits, so throughput follows the upstream limits.
+    If the caller stops early, the remaining questions are cancelled.
+    """
+    unique = await asyncio.to_thread(_prepare_batch, questions)
+    app = abuild_graph()
+    gate = asyncio.Semaphore(max(1, concurrency))
+
+    async def one(question):
+        async with gate:
+            try:
+                with llm_priority("batch"):
+                    return question, await app.ainvoke({"question": question, "k": k, "plan_mode": plan_mode})
+            except Exception as e:
+                return question, _batch_error(question, e)
+
+    tasks = [asyncio.ensure_future(one(q)) for q in unique]
+    try:
+        for done in asyncio.as_completed(tasks):
+            yield await done
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
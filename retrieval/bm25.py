@@ -0,0 +1,113 @@
+import heapq
+import json
+import math
+import re
+from collections import Counter
+from pathlib import Path
+
+BM25_NAME = "bm25.json"
+
+_TOKEN = re.compile(r"[a-z0-9]+(?:[-/][a-z0-9]+)*")
+STOPWORDS = frozenset("""
+a an and are as at be by for from has have how in is it its of on or that the
+their this to was what which with
+""".split())
+
+
+def tokenize(text: str) -> list:
+    return [t for t in _TOKEN.findall(text.lower()) if t not in STOPWORDS]
+
+
+class BM25Index:
+    """
+    In-process inverted index (Okapi BM25) over the indexed chunks.
+    Holds postings and chunk metadata only; chunk text stays in Chroma.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.ids = []
+        self.meta = []  # [source, page, chunk_id] per doc
+        self.lengths = []
+        self.postings = {}  # term -> [[doc, tf], ...]
+        self.avgdl = 0.0
+
+    def __len__(self):
+        return len(self.ids)
+
+    def add(self, doc_id: str, text: str, metadata: dict):
+        doc = len(self.ids)
+        terms = tokenize(text)
+        self.ids.append(doc_id)
+        self.meta.append([metadata.get("source"), metadata.get("page"), metadata.get("chunk_id")])
+        self.lengths.append(len(terms))
+        for term, tf in Counter(terms).items():
+            self.postings.setdefault(term, []).append([doc, tf])
+        self.avgdl += (len(terms) - self.avgdl) / len(self.lengths)
+
+    def doc_freq(self, term: str) -> int:
+        return len(self.postings.get(term, ()))
+
+    def idf(self, term: str) -> float:
+        df = self.doc_freq(term)
+        return math.log(1 + (len(self.ids) - df + 0.5) / (df + 0.5))
+
+    def search(self, query: str, n: int = 10) -> list:
+        """Top-n (doc index, score) pairs; only postings of the query terms are touched."""
+        scores = {}
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = self.idf(term)
+            for doc, tf in postings:
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[doc] / (self.avgdl or 1.0))
+                scores[doc] = scores.get(doc, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+        return heapq.nlargest(n, scores.items(), key=lambda x: x[1])
+
+    def is_exact_term_query(self, query: str, max_terms: int = 3, max_df_ratio: float = 0.05) -> bool:
+        # Short queries made of rare, indexed terms ("SaMD", a regulation name)
+        # are answered well by the lexical index alone.
+        terms = set(tokenize(query))
+        if not terms or len(terms) > max_terms or not self.ids:
+            return False
+        return all(0 < self.doc_freq(t) <= max_df_ratio * len(self.ids) for t in terms)
+
+    def hit(self, doc: int, score: float) -> dict:
+        source, page, chunk_id = self.meta[doc]
+        return {"id": self.ids[doc], "source": source, "page": page, "chunk_id": chunk_id, "bm25": score}
+
+    def save(self, path: Path):
+        data = {
+            "k1": self.k1, "b": self.b, "ids": self.ids, "meta": self.meta,
+            "lengths": self.lengths, "postings": self.postings,
+        }
+        tmp = Path(path).with_suffix(".tmp")
+        tmp.write_text(json.dumps(data, separators=(",", ":")), encoding="utf-8")
+        tmp.replace(path)
+
+    @classmethod
+    def load(cls, path: Path) -> "BM25Index":
+        data = json.loads(Path(path).read_text(encoding="utf-8"))
+        index = cls(k1=data["k1"], b=data["b"])
+        index.ids = data["ids"]
+        index.meta = data["meta"]
+        index.lengths = data["lengths"]
+        index.postings = data["postings"]
+        index.avgdl = sum(index.lengths) / len(index.lengths) if index.lengths else 0.0
+        return index
+
+    @classmethod
+    def from_collection(cls, collection, page_size: int = 1000) -> "BM25Index":
+        # Built from what Chroma holds, so it always matches the vector index.
+        index = cls()
+        offset = 0
+        while True:
+            page = collection.get(include=["documents", "metadatas"], limit=page_size, offset=offset)
+            if not page["ids"]:
+                break
+            for doc_id, text, meta in zip(page["ids"], page["documents"], page["metadatas"]):
+                index.add(doc_id, text or "", meta or {})
+            offset += len(page["ids"])
+        return index
@@ -0,0 +1,130 @@
+import json
+import mmap
+import os
+import tempfile
+from pathlib import Path
+
+# Written next to the Chroma index by index_documents().
+BLOB_NAME = "chunks.bin"
+META_NAME = "chunks.json"
+
+# Fields a research reference keeps in graph state; text, source and page
+# are resolved from the chunk store when needed.
+REF_FIELDS = ("chunk_id", "score", "rrf", "bm25", "rerank")
+
+
+class ChunkRecord:
+    __slots__ = ("chunk_id", "source", "page", "start", "end")
+
+    def __init__(self, chunk_id: str, source: str, page, start: int, end: int):
+        self.chunk_id = chunk_id
+        self.source = source
+        self.page = page
+        self.start = start
+        self.end = end
+
+
+class ChunkStore:
+    """
+    Every chunk's text in one UTF-8 blob, memory-mapped, with a small record
+    (source, page, byte offsets) per chunk_id. Text is decoded only when a
+    chunk is resolved.
+    """
+
+    def __init__(self, blob, records: dict, version: str = None):
+        self._blob = blob
+        self.records = records
+        self.version = version
+
+    def __len__(self):
+        return len(self.records)
+
+    def __contains__(self, chunk_id):
+        return chunk_id in self.records
+
+    def close(self):
+        # release the mapping; the handle calls this on close/reload
+        if isinstance(self._blob, mmap.mmap):
+            self._blob.close()
+        self._blob = b""
+
+    @classmethod
+    def load(cls, persist_dir: str) -> "ChunkStore":
+        root = Path(persist_dir)
+        meta = json.loads((root / META_NAME).read_text(encoding="utf-8"))
+        offsets = meta["offsets"]
+        records = {
+            chunk_id: ChunkRecord(chunk_id, source, page, offsets[i], offsets[i + 1])
+            for i, (chunk_id, source, page) in enumerate(zip(meta["chunk_ids"], meta["sources"], meta["pages"]))
+        }
+        blob = b""
+        if (root / BLOB_NAME).stat().st_size:
+            with open(root / BLOB_NAME, "rb") as f:
+                blob = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return cls(blob, records, meta.get("version"))
+
+    @staticmethod
+    def exists(persist_dir: str) -> bool:
+        return (Path(persist_dir) / BLOB_NAME).exists() and (Path(persist_dir) / META_NAME).exists()
+
+    @classmethod
+    def build(cls, collection, persist_dir: str, version: str = None, page_size: int = 1000) -> "ChunkStore":
+        """Write the collection's chunk texts and metadata, then load them."""
+        root = Path(persist_dir)
+        root.mkdir(parents=True, exist_ok=True)
+        chunk_ids, sources, pages, offsets = [], [], [], [0]
+        seen = set()
+
+        # unique temporary files swapped in with os.replace: live readers keep
+        # their mapping of the old blob, and never see a truncated one
+        fd, blob_tmp = tempfile.mkstemp(dir=root, prefix=BLOB_NAME + ".", suffix=".tmp")
+        with os.fdopen(fd, "wb") as out:
+            offset = 0
+            while True:
+                page = collection.get(include=["documents", "metadatas"], limit=page_size, offset=offset)
+                if not page["ids"]:
+                    break
+                for text, meta in zip(page["documents"], page["metadatas"]):
+                    meta = meta or {}
+                    chunk_id = meta.get("chunk_id")
+                    if not chunk_id or chunk_id in seen:
+                        continue
+                    seen.add(chunk_id)
+                    data = (text or "").encode("utf-8")
+                    out.write(data)
+                    chunk_ids.append(chunk_id)
+                    sources.append(meta.get("source"))
+                    pages.append(meta.get("page"))
+                    offsets.append(offsets[-1] + len(data))
+                offset += len(page["ids"])
+
+        meta = {"version": version, "chunk_ids": chunk_ids, "sources": sources, "pages": pages, "offsets": offsets}
+        fd, meta_tmp = tempfile.mkstemp(dir=root, prefix=META_NAME + ".", suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as out:
+            json.dump(meta, out)
+        os.replace(blob_tmp, root / BLOB_NAME)
+        os.replace(meta_tmp, root / META_NAME)
+        return cls.load(persist_dir)
+
+    def text(self, chunk_id: str) -> str:
+        record = self.records.get(chunk_id)
+        if record is None:
+            return ""
+        return self._blob[record.start:record.end].decode("utf-8")
+
+    def resolve(self, ref: dict) -> dict:
+        """Full hit dict for a research reference; refs that already carry text pass through."""
+        if ref.get("text") is not None:
+            return ref
+        record = self.records.get(ref.get("chunk_id"))
+        if record is None:
+            return dict(ref, text="", source=ref.get("source"), page=ref.get("page"))
+        return dict(ref, text=self.text(record.chunk_id), source=record.source, page=record.page)
+
+
+def to_refs(hits: list) -> list:
+    """Research references for graph state: chunk_id plus scores (whole hit if it has no chunk_id)."""
+    return [
+        {f: h[f] for f in REF_FIELDS if h.get(f) is not None} if h.get("chunk_id") else h
+        for h in hits
+    ]
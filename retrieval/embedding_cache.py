@@ -0,0 +1,139 @@
+import hashlib
+import sqlite3
+import threading
+from array import array
+from collections import OrderedDict
+from pathlib import Path
+from typing import List, Optional
+
+from utils.limits import upstream_limit
+from utils.metrics import record
+
+CACHE_PATH = ".cache/query_embeddings.sqlite"
+MEMORY_SIZE = 1024
+
+
+def model_name(embeddings) -> str:
+    return getattr(embeddings, "model", None) or type(embeddings).__name__
+
+
+class EmbeddingCache:
+    """
+    Two-tier cache for query embeddings, keyed by (embedding model, text):
+    an in-memory LRU in front of a persistent SQLite table.
+    """
+
+    def __init__(self, embeddings, path: str = CACHE_PATH, max_memory: int = MEMORY_SIZE):
+        self.embeddings = embeddings
+        self.model = model_name(embeddings)
+        self.max_memory = max_memory
+        self._memory: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, model TEXT, vector BLOB)"
+        )
+        self._db.commit()
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def _key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.model}\0{text}".encode("utf-8")).hexdigest()
+
+    def _remember(self, key: str, vector: List[float]):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory:
+            self._memory.popitem(last=False)
+
+    def get(self, text: str) -> Optional[List[float]]:
+        key = self._key(text)
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                record("embedding_cache_hits")
+                return self._memory[key]
+
+            row = self._db.execute("SELECT vector FROM embeddings WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+
+            vector = array("f", row[0]).tolist()
+            self._remember(key, vector)
+            self.disk_hits += 1
+            record("embedding_cache_hits")
+            return vector
+
+    def put(self, text: str, vector: List[float]):
+        key = self._key(text)
+        with self._lock:
+            self._remember(key, list(vector))
+            self._db.execute(
+                "INSERT OR REPLACE INTO embeddings (key, model, vector) VALUES (?, ?, ?)",
+                (key, self.model, array("f", vector).tobytes()),
+            )
+            self._db.commit()
+
+    def embed_query(self, text: str) -> List[float]:
+        vector = self.get(text)
+        if vector is not None:
+            return vector
+
+        with self._lock:
+            self.misses += 1
+        record("embedding_calls")
+        vector = self.embeddings.embed_query(text)
+        self.put(text, vector)
+        return vector
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        # Cache misses are embedded together in one batched request.
+        vectors = [self.get(t) for t in texts]
+        missing = list(dict.fromkeys(t for t, v in zip(texts, vectors) if v is None))
+
+        if missing:
+            with self._lock:
+                self.misses += len(missing)
+            record("embedding_calls")
+            fresh = dict(zip(missing, self.embeddings.embed_documents(missing)))
+            for text, vector in fresh.items():
+                self.put(text, vector)
+            vectors = [v if v is not None else fresh[t] for t, v in zip(texts, vectors)]
+
+        return vectors
+
+    async def aembed_queries(self, texts: List[str]) -> List[List[float]]:
+        # Lookups are local (memory / SQLite); only misses await the API.
+        vectors = [self.get(t) for t in texts]
+        missing = list(dict.fromkeys(t for t, v in zip(texts, vectors) if v is None))
+
+        if missing:
+            with self._lock:
+                self.misses += len(missing)
+            record("embedding_calls")
+            async with upstream_limit("embeddings"):
+                embedded = await self.embeddings.aembed_documents(missing)
+            fresh = dict(zip(missing, embedded))
+            for text, vector in fresh.items():
+                self.put(text, vector)
+            vectors = [v if v is not None else fresh[t] for t, v in zip(texts, vectors)]
+
+        return vectors
+
+    def warm(self, texts: List[str]):
+        self.embed_queries(texts)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "model": self.model,
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "memory_size": len(self._memory),
+            }
@@ -0,0 +1,247 @@
+import argparse
+import hashlib
+import json
+import queue
+import threading
+import time
+from pathlib import Path
+
+from retrieval.loader import iter_chunk_batches
+
+MANIFEST_NAME = "manifest.json"
+EMBED_BATCH_SIZE = 128
+QUEUE_DEPTH = 4
+MAX_BATCH_RETRIES = 3
+
+
+def file_hash(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def load_manifest(persist_dir: str) -> dict:
+    path = Path(persist_dir) / MANIFEST_NAME
+    if not path.exists():
+        return {"files": {}}
+    return json.loads(path.read_text(encoding="utf-8"))
+
+
+def save_manifest(persist_dir: str, manifest: dict):
+    path = Path(persist_dir) / MANIFEST_NAME
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(manifest, indent=2, sort_keys=True), encoding="utf-8")
+    tmp.replace(path)
+
+
+def plan_changes(data_dir: str, manifest: dict):
+    """
+    Compare data_dir against the manifest.
+    Returns (changed, removed, unchanged): changed is a list of (path, sha256),
+    removed a list of source names no longer on disk.
+    Files whose size and mtime match the manifest are not re-hashed.
+    """
+    files = manifest.get("files", {})
+    changed, unchanged = [], []
+
+    paths = sorted(Path(data_dir).glob("*.pdf"))
+    for path in paths:
+        st = path.stat()
+        entry = files.get(path.name)
+        if entry and entry["size"] == st.st_size and entry["mtime"] == st.st_mtime:
+            unchanged.append(path.name)
+            continue
+
+        digest = file_hash(path)
+        if entry and entry["sha256"] == digest:
+            # touched but identical: refresh mtime, keep its chunks
+            entry["mtime"] = st.st_mtime
+            unchanged.append(path.name)
+            continue
+        changed.append((path, digest))
+
+    on_disk = {p.name for p in paths}
+    removed = [name for name in files if name not in on_disk]
+    return changed, removed, unchanged
+
+
+_DONE = object()
+
+
+def stream_batches(paths, batch_size: int, max_workers: int = None, stats: list = None, depth: int = QUEUE_DEPTH):
+    """
+    Run parse/chunk (loader.iter_chunk_batches) in a background thread feeding
+    a bounded queue. When the embedder falls behind the queue fills up and the
+    producer blocks, so at most `depth` batches wait in memory.
+    """
+    q = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for item in iter_chunk_batches(paths, batch_size=batch_size, max_workers=max_workers, stats=stats):
+                if not put(item):
+                    return
+        except BaseException as e:
+            put(e)
+        finally:
+            put(_DONE)
+
+    producer = threading.Thread(target=produce, name="ingest-producer", daemon=True)
+    producer.start()
+    try:
+        while True:
+            item = q.get()
+            if item is _DONE:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stop.set()
+        producer.join(timeout=5)
+
+
+def _with_retries(fn, attempts: int = MAX_BATCH_RETRIES, base_delay: float = 1.0):
+    for attempt in range(attempts):
+        try:
+            return fn()
+        except Exception:
+            if attempt == attempts - 1:
+                raise
+            time.sleep(base_delay * 2 ** attempt)
+
+
+def _upsert_batch(vectordb, chunks):
+    texts = [c.page_content for c in chunks]
+    vectors = _with_retries(lambda: vectordb.embeddings.embed_documents(texts))
+    _with_retries(lambda: vectordb._collection.upsert(
+        ids=[c.metadata["chunk_id"] for c in chunks],
+        embeddings=vectors,
+        metadatas=[c.metadata for c in chunks],
+        documents=texts,
+    ))
+
+
+def index_incremental(
+    vectordb,
+    data_dir: str,
+    persist_dir: str,
+    full: bool = False,
+    batch_size: int = EMBED_BATCH_SIZE,
+    max_workers: int = None,
+    progress=None,
+) -> dict:
+    """
+    Embed and upsert only new or changed PDFs, and delete chunks of removed ones.
+    Chunk IDs are content-derived (see loader.stable_chunk_id), so unchanged
+    documents keep their citation tags.
+
+    Ingestion streams load -> chunk -> embed -> upsert in batches of batch_size.
+    Every committed batch is checkpointed in the manifest ("in_progress"), so
+    a run that fails midway resumes after the last committed batch of each
+    file. progress, if given, is called with a dict after every batch.
+    """
+    manifest = {"files": {}} if full else load_manifest(persist_dir)
+    changed, removed, unchanged = plan_changes(data_dir, manifest)
+    files = manifest.setdefault("files", {})
+    in_progress = manifest.setdefault("in_progress", {})
+
+    for name in removed:
+        vectordb._collection.delete(where={"source": name})
+        del files[name]
+        in_progress.pop(name, None)
+
+    digests = {path.name: digest for path, digest in changed}
+    file_stats = []
+    seen = {}
+    chunks_added = 0
+    chunks_skipped = 0
+
+    batches = stream_batches(
+        [path for path, _ in changed], batch_size=batch_size, max_workers=max_workers, stats=file_stats
+    )
+    for source, chunks, last in batches:
+        if source not in seen:
+            seen[source] = 0
+            checkpoint = in_progress.get(source)
+            if not checkpoint or checkpoint["sha256"] != digests[source]:
+                # fresh start: replace whatever this file had (including legacy chunk ids)
+                vectordb._collection.delete(where={"source": source})
+                in_progress[source] = {"sha256": digests[source], "committed": 0}
+
+        checkpoint = in_progress[source]
+        position = seen[source]
+        seen[source] = position + len(chunks)
+
+        # resume: skip chunks committed by an earlier, interrupted run
+        todo = chunks[max(0, checkpoint["committed"] - position):]
+        chunks_skipped += len(chunks) - len(todo)
+        if todo:
+            _upsert_batch(vectordb, todo)
+            chunks_added += len(todo)
+            checkpoint["committed"] = seen[source]
+
+        total = next(f["chunks"] for f in file_stats if f["source"] == source)
+        if last:
+            st = (Path(data_dir) / source).stat()
+            files[source] = {
+                "sha256": digests[source],
+                "mtime": st.st_mtime,
+                "size": st.st_size,
+                "chunks": total,
+            }
+            del in_progress[source]
+        save_manifest(persist_dir, manifest)
+
+        if progress is not None:
+            progress({"source": source, "committed": seen[source], "chunks": total, "done": last})
+
+    save_manifest(persist_dir, manifest)
+    return {
+        "added": [p.name for p, _ in changed],
+        "removed": removed,
+        "unchanged": len(unchanged),
+        "chunks_added": chunks_added,
+        "chunks_skipped": chunks_skipped,
+        "files": file_stats,
+    }
+
+
+def main():
+    from retrieval.vector_store import index_documents
+
+    parser = argparse.ArgumentParser(description="Index the PDFs in data/ into Chroma.")
+    parser.add_argument("--data-dir", default="data")
+    parser.add_argument("--full", action="store_true", help="re-embed every document")
+    parser.add_argument("--batch-size", type=int, default=EMBED_BATCH_SIZE)
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    def report(p):
+        print(f"{p['source']}: {p['committed']}/{p['chunks']} chunks")
+
+    summary = index_documents(
+        args.data_dir,
+        full=args.full,
+        batch_size=args.batch_size,
+        max_workers=args.workers,
+        progress=report,
+    )
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
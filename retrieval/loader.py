@@ -1,22 +1,109 @@
+import hashlib
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
 from pathlib import Path
 from langchain_community.document_loaders import PyPDFLoader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 
 
 
+def load_file(path: Path):
+    loaded = PyPDFLoader(str(path)).load()
+    for d in loaded:
+        d.metadata["source"] = path.name
+    return loaded
+
+
 def load_documents(data_dir: str):
     docs = []
-    for path in Path(data_dir).glob("*.pdf"):
-        loaded = PyPDFLoader(str(path)).load()
-        for d in loaded:
-            d.metadata["source"] = path.name
-        docs.extend(loaded)
+    for path in sorted(Path(data_dir).glob("*.pdf")):
+        docs.extend(load_file(path))
     return docs
 
 
+def stable_chunk_id(source: str, text: str, occurrence: int = 0) -> str:
+    # Derived from the chunk's own file and content, so adding or removing
+    # other documents never renumbers it.
+    digest = hashlib.sha1(f"{source}\0{occurrence}\0{text}".encode("utf-8")).hexdigest()
+    return f"chunk_{digest[:12]}"
+
+
 def chunk_documents(documents):
     splitter = RecursiveCharacterTextSplitter(chunk_size=900, chunk_overlap=150)
     chunks = splitter.split_documents(documents)
-    for i, c in enumerate(chunks):
-        c.metadata["chunk_id"] = f"chunk_{i}"
+
+    seen = {}
+    for c in chunks:
+        source = c.metadata.get("source", "")
+        key = (source, c.page_content)
+        occurrence = seen.get(key, 0)
+        seen[key] = occurrence + 1
+        c.metadata["chunk_id"] = stable_chunk_id(source, c.page_content, occurrence)
     return chunks
+
+
+def parse_and_chunk(path: str) -> dict:
+    # Runs in a worker process: parse one PDF and chunk its pages.
+    start = time.perf_counter()
+    pages = load_file(Path(path))
+    chunks = chunk_documents(pages)
+    return {
+        "source": Path(path).name,
+        "pages": len(pages),
+        "chunks": chunks,
+        "parse_seconds": time.perf_counter() - start,
+    }
+
+
+def _iter_parsed(paths, max_workers: int):
+    if max_workers <= 1 or len(paths) <= 1:
+        for path in paths:
+            yield parse_and_chunk(str(path))
+        return
+
+    # At most max_workers files are in flight, so parsed-but-unconsumed
+    # results never pile up while the indexer is busy embedding.
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        todo = iter(paths)
+        pending = set()
+        for path in todo:
+            pending.add(pool.submit(parse_and_chunk, str(path)))
+            if len(pending) >= max_workers:
+                break
+
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in done:
+                nxt = next(todo, None)
+                if nxt is not None:
+                    pending.add(pool.submit(parse_and_chunk, str(nxt)))
+                yield fut.result()
+
+
+def iter_chunk_batches(paths, batch_size: int = 256, max_workers: int = None, stats: list = None):
+    """
+    Parse and chunk PDFs in parallel across processes and stream the chunks
+    in batches of at most batch_size, in file completion order.
+    Yields (source, chunks, last) where last marks a file's final batch.
+    Per-file {source, pages, chunks, parse_seconds} are appended to stats.
+    """
+    paths = list(paths)
+    if max_workers is None:
+        max_workers = min(len(paths), os.cpu_count() or 1)
+
+    for parsed in _iter_parsed(paths, max_workers):
+        chunks = parsed["chunks"]
+        if stats is not None:
+            stats.append({
+                "source": parsed["source"],
+                "pages": parsed["pages"],
+                "chunks": len(chunks),
+                "parse_seconds": round(parsed["parse_seconds"], 3),
+            })
+
+        if not chunks:
+            yield parsed["source"], [], True
+            continue
+        for i in range(0, len(chunks), batch_size):
+            yield parsed["source"], chunks[i:i + batch_size], i + batch_size >= len(chunks)
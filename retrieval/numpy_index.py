@@ -0,0 +1,250 @@
+import json
+import os
+import threading
+from pathlib import Path
+
+import numpy as np
+
+# Files written next to the Chroma index by index_documents().
+VECTORS_NAME = "vectors.npy"
+NORMS_NAME = "vectors_norms.npy"
+META_NAME = "vectors.json"
+INT8_NAME = "vectors_int8.npy"
+INT8_RANGE_NAME = "vectors_int8_range.npy"
+BINARY_NAME = "vectors_binary.npy"
+BINARY_RANGE_NAME = "vectors_binary_range.npy"
+LEGACY_TEXTS_NAME = "vectors_texts.json"
+
+# "none": exact search over the float32 matrix. "int8" (per-dimension scalar
+# codes, 4x smaller) or "binary" (one bit per dimension, ~30x smaller): a first
+# pass over the compact codes held in RAM, then exact rescoring of
+# n_results * RESCORE_FACTORS[mode] candidates read from the memory-mapped matrix.
+VECTOR_QUANTIZATION = os.getenv("VECTOR_QUANTIZATION", "none")
+QUANTIZATIONS = ("none", "int8", "binary")
+RESCORE_FACTORS = {
+    "int8": int(os.getenv("INT8_RESCORE_FACTOR", "4")),
+    "binary": int(os.getenv("BINARY_RESCORE_FACTOR", "20")),
+}
+
+DECODE_BLOCK = 4096
+
+
+
+def quantize_int8(matrix: np.ndarray):
+    """Per-dimension affine int8 codes; returns (codes, [low, scale] per dimension)."""
+    low = matrix.min(axis=0) if len(matrix) else np.zeros(matrix.shape[1], dtype=np.float32)
+    high = matrix.max(axis=0) if len(matrix) else np.zeros(matrix.shape[1], dtype=np.float32)
+    scale = np.where(high > low, (high - low) / 255.0, 1.0).astype(np.float32)
+    codes = np.clip(np.rint((matrix - low) / scale) - 128, -128, 127).astype(np.int8)
+    return codes, np.stack([low, scale]).astype(np.float32)
+
+
+def quantize_binary(matrix: np.ndarray):
+    """
+    One bit per dimension: above or below the dimension's mean (signs alone
+    say little about sparse, non-negative-heavy embeddings). Returns
+    (packed bits, [threshold, low, high] per dimension), where low/high are
+    the mean value on each side, used to score float queries asymmetrically.
+    """
+    matrix = np.asarray(matrix, dtype=np.float32)
+    threshold = matrix.mean(axis=0) if len(matrix) else np.zeros(matrix.shape[1], dtype=np.float32)
+    above = matrix > threshold
+    n_above = above.sum(axis=0)
+    n_below = len(matrix) - n_above
+    high = np.where(n_above, (matrix * above).sum(axis=0) / np.maximum(n_above, 1), threshold)
+    low = np.where(n_below, (matrix * ~above).sum(axis=0) / np.maximum(n_below, 1), threshold)
+    return np.packbits(above, axis=1), np.stack([threshold, low, high]).astype(np.float32)
+
+
+class NumpyIndex:
+    """
+    Exact in-process vector index: all chunk embeddings as one contiguous
+    float32 matrix, memory-mapped read-only, with parallel metadata arrays.
+    Hits carry chunk IDs, not text (that's in the chunk store).
+    Scores are squared L2 distances, like Chroma's default space, so hits
+    from either backend rank and fuse the same way.
+    """
+
+    def __init__(self, matrix: np.ndarray, norms: np.ndarray, meta: dict, root: Path,
+                 quantization: str = VECTOR_QUANTIZATION):
+        if quantization not in QUANTIZATIONS:
+            raise ValueError(f"Unknown VECTOR_QUANTIZATION: {quantization}")
+        self.quantization = quantization
+        self.version = meta.get("version")
+        self.matrix = matrix
+        self.norms = norms  # squared row norms
+        self.ids = meta["ids"]
+        self.sources = meta["sources"]
+        self.pages = meta["pages"]
+        self.chunk_ids = meta["chunk_ids"]
+        self._root = root
+        self._codes = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.ids)
+
+    def codes(self, mode: str):
+        # compact codes are read fully into RAM (that's the point); the float
+        # matrix stays memory-mapped and is only touched for rescoring
+        with self._lock:
+            if mode not in self._codes:
+                if mode == "int8":
+                    self._codes[mode] = (np.load(self._root / INT8_NAME), np.load(self._root / INT8_RANGE_NAME))
+                else:
+                    self._codes[mode] = (np.load(self._root / BINARY_NAME), np.load(self._root / BINARY_RANGE_NAME))
+            return self._codes[mode]
+
+    def memory_bytes(self) -> dict:
+        """Size of the vectors per representation (float32 is the on-disk matrix)."""
+        int8_codes, int8_range = self.codes("int8")
+        binary_codes, binary_range = self.codes("binary")
+        return {
+            "none": int(self.matrix.nbytes + self.norms.nbytes),
+            "int8": int(int8_codes.nbytes + int8_range.nbytes + self.norms.nbytes),
+            "binary": int(binary_codes.nbytes + binary_range.nbytes + self.norms.nbytes),
+        }
+
+    @classmethod
+    def load(cls, persist_dir: str, quantization: str = VECTOR_QUANTIZATION) -> "NumpyIndex":
+        root = Path(persist_dir)
+        matrix = np.load(root / VECTORS_NAME, mmap_mode="r")
+        norms = np.load(root / NORMS_NAME, mmap_mode="r")
+        meta = json.loads((root / META_NAME).read_text(encoding="utf-8"))
+        return cls(matrix, norms, meta, root, quantization)
+
+    @staticmethod
+    def exists(persist_dir: str) -> bool:
+        names = (VECTORS_NAME, NORMS_NAME, META_NAME, INT8_NAME, INT8_RANGE_NAME, BINARY_NAME, BINARY_RANGE_NAME)
+        return all((Path(persist_dir) / name).exists() for name in names)
+
+    @classmethod
+    def build(cls, collection, persist_dir: str, version: str = None, page_size: int = 1000) -> "NumpyIndex":
+        """
+        Export the Chroma collection's embeddings and metadata, then load the
+        files. version (the index manifest version) marks which ingest it
+        reflects, so a stale export is rebuilt rather than served.
+        """
+        ids, sources, pages, chunk_ids, rows = [], [], [], [], []
+        offset = 0
+        while True:
+            page = collection.get(
+                include=["embeddings", "metadatas"], limit=page_size, offset=offset
+            )
+            if not len(page["ids"]):
+                break
+            for doc_id, emb, meta in zip(page["ids"], page["embeddings"], page["metadatas"]):
+                meta = meta or {}
+                ids.append(doc_id)
+                sources.append(meta.get("source"))
+                pages.append(meta.get("page"))
+                chunk_ids.append(meta.get("chunk_id"))
+                rows.append(np.asarray(emb, dtype=np.float32))
+            offset += len(page["ids"])
+
+        matrix = np.stack(rows) if rows else np.zeros((0, 0), dtype=np.float32)
+        root = Path(persist_dir)
+        root.mkdir(parents=True, exist_ok=True)
+        int8_codes, int8_range = quantize_int8(matrix)
+        binary_codes, binary_range = quantize_binary(matrix)
+        arrays = (
+            (VECTORS_NAME, matrix),
+            (NORMS_NAME, np.einsum("ij,ij->i", matrix, matrix)),
+            (INT8_NAME, int8_codes),
+            (INT8_RANGE_NAME, int8_range),
+            (BINARY_NAME, binary_codes),
+            (BINARY_RANGE_NAME, binary_range),
+        )
+        # write to temporary names, then swap in, so readers never see half a file
+        for name, array in arrays:
+            with open(root / (name + ".tmp"), "wb") as f:
+                np.save(f, np.ascontiguousarray(array))
+            (root / (name + ".tmp")).replace(root / name)
+        meta = {"version": version, "ids": ids, "sources": sources, "pages": pages, "chunk_ids": chunk_ids}
+        (root / (META_NAME + ".tmp")).write_text(json.dumps(meta), encoding="utf-8")
+        (root / (META_NAME + ".tmp")).replace(root / META_NAME)
+        # texts live in the chunk store; drop the copy older exports wrote
+        (root / LEGACY_TEXTS_NAME).unlink(missing_ok=True)
+        return cls.load(persist_dir)
+
+    def distances(self, vectors) -> np.ndarray:
+        # ||q - x||^2 = ||q||^2 + ||x||^2 - 2 q.x, for all queries at once
+        queries = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+        dots = queries @ self.matrix.T
+        dist = self.norms[None, :] + np.einsum("ij,ij->i", queries, queries)[:, None] - 2.0 * dots
+        return np.maximum(dist, 0.0)
+
+    def top_k(self, dist: np.ndarray, n: int):
+        # argpartition for the n smallest per row, then sort just those
+        n = min(n, dist.shape[1])
+        if n == 0:
+            return np.zeros((dist.shape[0], 0), dtype=np.int64)
+        top = np.argpartition(dist, n - 1, axis=1)[:, :n]
+        order = np.argsort(np.take_along_axis(dist, top, axis=1), axis=1)
+        return np.take_along_axis(top, order, axis=1)
+
+    def hits(self, rows, scores) -> list:
+        return [
+            {
+                "source": self.sources[row],
+                "page": self.pages[row],
+                "chunk_id": self.chunk_ids[row],
+                "score": float(score),
+            }
+            for row, score in zip(rows, scores)
+        ]
+
+    def _approximate(self, queries: np.ndarray, mode: str) -> np.ndarray:
+        # first-pass distances over compact codes; only their order matters
+        if mode == "int8":
+            codes, (low, scale) = self.codes("int8")
+            weighted = queries * scale
+            dots = np.empty((len(queries), len(codes)), dtype=np.float32)
+            for start in range(0, len(codes), DECODE_BLOCK):
+                # widen one block of codes at a time, never the whole matrix
+                block = codes[start:start + DECODE_BLOCK].astype(np.float32)
+                dots[:, start:start + DECODE_BLOCK] = weighted @ block.T
+            # x ~ low + scale * (code + 128)
+            dots += (queries @ low + 128.0 * weighted.sum(axis=1))[:, None]
+            return self.norms[None, :] - 2.0 * dots
+
+        # asymmetric: the float query against each dimension's low/high value
+        codes, (_, low, high) = self.codes("binary")
+        weighted = queries * (high - low)
+        dots = np.empty((len(queries), len(codes)), dtype=np.float32)
+        for start in range(0, len(codes), DECODE_BLOCK):
+            bits = np.unpackbits(codes[start:start + DECODE_BLOCK], axis=1, count=queries.shape[1])
+            dots[:, start:start + DECODE_BLOCK] = weighted @ bits.T.astype(np.float32)
+        # x ~ low + (high - low) * bit
+        dots += (queries @ low)[:, None]
+        return self.norms[None, :] - 2.0 * dots
+
+    def _rescore(self, queries: np.ndarray, candidates: np.ndarray):
+        # exact squared L2 for each query's candidate rows only
+        rows = np.asarray(self.matrix[candidates.ravel()], dtype=np.float32).reshape(*candidates.shape, -1)
+        dots = np.einsum("md,mkd->mk", queries, rows)
+        norms = np.asarray(self.norms)[candidates]
+        return np.maximum(norms + np.einsum("ij,ij->i", queries, queries)[:, None] - 2.0 * dots, 0.0)
+
+    def search(self, vectors, n_results: int, quantization: str = None) -> list:
+        """
+        Top-n per query vector. Exact mode is one matrix product plus
+        argpartition; quantized modes shortlist candidates over the codes and
+        rescore them at full precision.
+        """
+        if not len(self.ids):
+            return [[] for _ in vectors]
+        mode = quantization or self.quantization
+        queries = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+
+        if mode == "none":
+            dist = self.distances(queries)
+            top = self.top_k(dist, n_results)
+            scores = np.take_along_axis(dist, top, axis=1)
+        else:
+            candidates = self.top_k(self._approximate(queries, mode), n_results * RESCORE_FACTORS[mode])
+            exact = self._rescore(queries, candidates)
+            order = self.top_k(exact, n_results)
+            top = np.take_along_axis(candidates, order, axis=1)
+            scores = np.take_along_axis(exact, order, axis=1)
+        return [self.hits(rows, row_scores) for rows, row_scores in zip(top.tolist(), scores.tolist())]
@@ -1,10 +1,10 @@
 from dotenv import load_dotenv
 load_dotenv()
 
-from retrieval.vector_store import index_documents, retrieve
+from retrieval.vector_store import index_documents, retrieve, store
 
 print("Indexing documents...")
-index_documents("data")
+print(index_documents("data"))
 
 print("\nTesting retrieval...\n")
 results = retrieve("AI copilot adoption in hospital operations", k=3)
@@ -15,3 +15,6 @@ for r in results:
     print("CHUNK:", r["chunk_id"])
     print("SCORE:", r["score"])
     print("-" * 50)
+
+retrieve("AI governance oversight in hospitals", k=3)
+print("STORE:", store.stats())
@@ -1,71 +1,507 @@
+import asyncio
+import hashlib
+import os
+import threading
+from collections import OrderedDict
 from pathlib import Path
 from dotenv import load_dotenv
 
 load_dotenv()
 
-from langchain_openai import OpenAIEmbeddings
 from langchain_chroma import Chroma
 
-from retrieval.loader import load_documents, chunk_documents
+from retrieval.bm25 import BM25_NAME, BM25Index
+from retrieval.chunk_store import ChunkStore
+from retrieval.embedding_cache import EmbeddingCache
+from retrieval.ingest import MANIFEST_NAME, index_incremental, load_manifest
+from retrieval.numpy_index import NumpyIndex
+from utils.limits import upstream_limit
+from utils.metrics import record
+from utils.providers import get_embeddings
 
-PERSIST_DIR = ".chroma"
+# Use a separate directory per embeddings provider; vectors aren't interchangeable.
+PERSIST_DIR = os.getenv("CHROMA_DIR", ".chroma")
 
+# "hybrid" fuses BM25 and vector hits; "vector" is embeddings only.
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "hybrid")
 
-def index_documents(data_dir: str = "data"):
-    embeddings = OpenAIEmbeddings()
+# Where vector search runs: "chroma", or "numpy" for an exact in-process
+# index over a memory-mapped float32 matrix exported from the collection.
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma")
 
-    docs = load_documents(data_dir)
-    chunks = chunk_documents(docs)
+# Per-query search results (chunk IDs and scores) kept for reuse across
+# questions (batch runs, retries, the fixed expansion queries); dropped
+# whenever the index changes.
+RESULT_MEMO_SIZE = int(os.getenv("RETRIEVAL_MEMO_SIZE", "2048"))
 
-    vectordb = Chroma.from_documents(
-        documents=chunks,
-        embedding=embeddings,
-        persist_directory=PERSIST_DIR,
+
+class VectorStoreHandle:
+    """Process-wide Chroma handle: opened once, reused by every retrieval."""
+
+    def __init__(self, persist_dir: str = PERSIST_DIR):
+        self.persist_dir = persist_dir
+        self._lock = threading.RLock()
+        self._embeddings = None
+        self._query_cache = None
+        self._db = None
+        self._backend = None
+        self._lexical = None
+        self._chunks = None
+        self._version = None
+        self._manifest_stamp = None
+        self._results = OrderedDict()
+        self.opens = 0
+        self.reuses = 0
+
+    def embeddings(self):
+        with self._lock:
+            if self._embeddings is None:
+                self._embeddings = get_embeddings()
+            return self._embeddings
+
+    def query_cache(self) -> EmbeddingCache:
+        with self._lock:
+            if self._query_cache is None:
+                self._query_cache = EmbeddingCache(self.embeddings())
+            return self._query_cache
+
+    def get(self, data_dir: str = "data"):
+        with self._lock:
+            self.version()
+            if self._db is not None:
+                self.reuses += 1
+                return self._db
+
+            # If the persisted DB doesn't exist yet, create it
+            if not Path(self.persist_dir).exists():
+                index_documents(data_dir)
+
+            self._db = Chroma(
+                persist_directory=self.persist_dir,
+                embedding_function=self.embeddings(),
+            )
+            self.opens += 1
+            return self._db
+
+    def backend(self, data_dir: str = "data", kind: str = None):
+        """Vector search backend: ChromaBackend or NumpyIndex (see VECTOR_BACKEND)."""
+        kind = kind or VECTOR_BACKEND
+        with self._lock:
+            self.version()
+            if self._backend is not None and self._backend[0] == kind:
+                self.reuses += 1
+                return self._backend[1]
+
+            if kind == "chroma":
+                backend = ChromaBackend(self.get(data_dir))
+            elif kind == "numpy":
+                # the numpy backend never opens Chroma unless its export is missing or stale
+                if not Path(self.persist_dir).exists():
+                    index_documents(data_dir)
+                backend = NumpyIndex.load(self.persist_dir) if NumpyIndex.exists(self.persist_dir) else None
+                if backend is None or backend.version != self.version():
+                    backend = NumpyIndex.build(self.get(data_dir)._collection, self.persist_dir, self.version())
+            else:
+                raise ValueError(f"Unknown VECTOR_BACKEND: {kind}")
+            self._backend = (kind, backend)
+            return backend
+
+    def chunks(self, data_dir: str = "data") -> ChunkStore:
+        # chunk texts for research references; rebuilt like the numpy export
+        with self._lock:
+            self.version()
+            if self._chunks is None:
+                if not Path(self.persist_dir).exists():
+                    index_documents(data_dir)
+                chunks = ChunkStore.load(self.persist_dir) if ChunkStore.exists(self.persist_dir) else None
+                if chunks is None or chunks.version != self.version():
+                    chunks = ChunkStore.build(self.get(data_dir)._collection, self.persist_dir, self.version())
+                self._chunks = chunks
+            return self._chunks
+
+    def lexical(self, data_dir: str = "data") -> BM25Index:
+        # BM25 index persisted next to the Chroma files; rebuilt from the
+        # collection if an older index directory doesn't have one yet.
+        with self._lock:
+            self.version()
+            if self._lexical is None:
+                path = Path(self.persist_dir) / BM25_NAME
+                if path.exists():
+                    self._lexical = BM25Index.load(path)
+                else:
+                    self._lexical = BM25Index.from_collection(self.get(data_dir)._collection)
+                    self._lexical.save(path)
+            return self._lexical
+
+    def memo_get(self, key):
+        with self._lock:
+            hits = self._results.get(key)
+            if hits is None:
+                return None
+            self._results.move_to_end(key)
+            return [dict(h) for h in hits]
+
+    def memo_put(self, key, hits: list):
+        # IDs and scores only; text is decoded from the chunk store on use
+        hits = [{f: v for f, v in h.items() if f != "text"} if h.get("chunk_id") else dict(h) for h in hits]
+        with self._lock:
+            self._results[key] = hits
+            self._results.move_to_end(key)
+            while len(self._results) > RESULT_MEMO_SIZE:
+                self._results.popitem(last=False)
+
+    def memo_clear(self):
+        with self._lock:
+            self._results.clear()
+
+    def version(self) -> str:
+        # Changes whenever the indexed file set changes; used to invalidate caches.
+        # The manifest is stat'ed on every call, so a reindex by another
+        # process (python -m retrieval.ingest) is seen too: everything derived
+        # from the old index is dropped and reopened on next use.
+        with self._lock:
+            path = Path(self.persist_dir) / MANIFEST_NAME
+            stat = path.stat() if path.exists() else None
+            stamp = (stat.st_mtime_ns, stat.st_size) if stat else None
+            if self._version is None or stamp != self._manifest_stamp:
+                files = load_manifest(self.persist_dir).get("files", {})
+                digest = hashlib.sha256()
+                for name in sorted(files):
+                    digest.update(f"{name}:{files[name].get('sha256')}\n".encode("utf-8"))
+                version = digest.hexdigest()[:16]
+                if self._version is not None and version != self._version:
+                    record("index_reloads")
+                    self._drop_derived()
+                self._version = version
+                self._manifest_stamp = stamp
+            return self._version
+
+    def _drop_derived(self):
+        self._db = None
+        self._backend = None
+        self._lexical = None
+        if self._chunks is not None:
+            self._chunks.close()
+        self._chunks = None
+        self._results.clear()
+
+    def close(self):
+        # Drop the collection handle; the embeddings client is kept for reuse.
+        with self._lock:
+            self._drop_derived()
+            self._version = None
+            self._manifest_stamp = None
+
+    def reload(self, data_dir: str = "data"):
+        # Call after reindexing so later retrievals see the new collection.
+        with self._lock:
+            self.close()
+            return self.get(data_dir)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "open": self._db is not None,
+                "version": self._version,
+                "opens": self.opens,
+                "reuses": self.reuses,
+            }
+
+
+class ChromaBackend:
+    """Vector search through the Chroma collection (hits include the text it returns)."""
+
+    def __init__(self, db):
+        self.db = db
+
+    def search(self, vectors, n_results: int) -> list:
+        res = self.db._collection.query(
+            query_embeddings=vectors,
+            n_results=n_results,
+            include=["documents", "metadatas", "distances"],
+        )
+        per_query = []
+        for docs, metas, dists in zip(res["documents"], res["metadatas"], res["distances"]):
+            hits = []
+            for text, meta, dist in zip(docs, metas, dists):
+                meta = meta or {}
+                hits.append({
+                    "text": text,
+                    "source": meta.get("source"),
+                    "page": meta.get("page"),
+                    "chunk_id": meta.get("chunk_id"),
+                    "score": float(dist),
+                })
+            per_query.append(hits)
+        return per_query
+
+
+store = VectorStoreHandle()
+
+
+def index_documents(data_dir: str = "data", full: bool = False, **ingest_options) -> dict:
+    """
+    Bring the persisted collection in line with data_dir. Only new or changed
+    PDFs are embedded; pass full=True to re-embed everything.
+    ingest_options (batch_size, max_workers, progress) go to index_incremental.
+    """
+    vectordb = Chroma(
+        persist_directory=store.persist_dir,
+        embedding_function=store.embeddings(),
     )
+    if full:
+        vectordb.reset_collection()
 
     # In langchain-chroma, persistence is automatic when persist_directory is used.
-    return vectordb
+    summary = index_incremental(vectordb, data_dir, store.persist_dir, full=full, **ingest_options)
+    # no embeddings involved: rebuild the lexical index from the collection
+    BM25Index.from_collection(vectordb._collection).save(Path(store.persist_dir) / BM25_NAME)
+    store.close()
+    ChunkStore.build(vectordb._collection, store.persist_dir, store.version())
+    if VECTOR_BACKEND == "numpy":
+        NumpyIndex.build(vectordb._collection, store.persist_dir, store.version())
+    return summary
 
 
 def get_vectorstore(data_dir: str = "data"):
-    # If the persisted DB doesn't exist yet, create it
-    if not Path(PERSIST_DIR).exists():
-        return index_documents(data_dir)
-
-    embeddings = OpenAIEmbeddings()
-    return Chroma(
-        persist_directory=PERSIST_DIR,
-        embedding_function=embeddings,
-    )
+    return store.get(data_dir)
 
 
-def retrieve(query: str, k: int = 5, data_dir: str = "data"):
-    vectordb = get_vectorstore(data_dir=data_dir)
-    results = vectordb.similarity_search_with_score(query, k=min(30, max(10, k * 5)))
+def resolve_research(research: list, data_dir: str = "data") -> list:
+    """
+    Research references (chunk_id + scores, as kept in graph state) as full
+    hits with text, source and page from the chunk store. Items that
+    already carry text are returned unchanged, without opening the store.
+    """
+    research = research or []
+    if all(r.get("text") is not None for r in research):
+        return research
+    chunks = store.chunks(data_dir)
+    return [chunks.resolve(r) for r in research]
 
-    seen = set()
-    formatted = []
 
-    for doc, score in results:
-        key = (
-            doc.metadata.get("source"),
-            doc.metadata.get("page"),
-            doc.metadata.get("chunk_id"),
-        )
-        if key in seen:
-            continue
-        seen.add(key)
+RRF_K = 60
+
+
+def _hit_key(hit: dict):
+    return (hit.get("source"), hit.get("page"), hit.get("chunk_id"))
+
+
+def _search(backend, vectors, n_results: int):
+    # One batched backend query for all vectors; returns a hit list per vector.
+    record("vector_searches")
+    record("retrieval_queries", len(vectors))
+
+    per_query = []
+    for results in backend.search(vectors, n_results):
+        hits = []
+        seen = set()
+        for hit in results:
+            if _hit_key(hit) in seen:
+                continue
+            seen.add(_hit_key(hit))
+            hits.append(hit)
+        per_query.append(hits)
+    return per_query
+
+
+def _memo_lookup(kind: str, queries: list, n_results: int):
+    # (per-query hits with None where not memoized, the queries still to search)
+    per_query = [store.memo_get((kind, q, n_results)) for q in queries]
+    missing = [q for q, hits in zip(queries, per_query) if hits is None]
+    if len(missing) < len(queries):
+        record("retrieval_memo_hits", len(queries) - len(missing))
+    return per_query, missing
+
+
+def _memo_fill(kind: str, queries: list, n_results: int, per_query: list, searched: list):
+    found = iter(searched)
+    for i, hits in enumerate(per_query):
+        if hits is None:
+            per_query[i] = next(found)
+            store.memo_put((kind, queries[i], n_results), per_query[i])
+    return per_query
+
+
+def _vector_hits(backend, queries: list, n_results: int):
+    per_query, missing = _memo_lookup("vector", queries, n_results)
+    searched = []
+    if missing:
+        searched = _search(backend, store.query_cache().embed_queries(missing), n_results)
+    return _memo_fill("vector", queries, n_results, per_query, searched)
+
+
+async def _avector_hits(backend, queries: list, n_results: int):
+    per_query, missing = _memo_lookup("vector", queries, n_results)
+    searched = []
+    if missing:
+        vectors = await store.query_cache().aembed_queries(missing)
+        async with upstream_limit("vectorstore"):
+            searched = await asyncio.to_thread(_search, backend, vectors, n_results)
+    return _memo_fill("vector", queries, n_results, per_query, searched)
+
+
+def _fuse_min(per_query):
+    # keep best (lowest distance) per chunk; Chroma distance: smaller = closer
+    best = {}
+    for hits in per_query:
+        for hit in hits:
+            key = _hit_key(hit)
+            if key not in best or hit["score"] < best[key]["score"]:
+                best[key] = hit
+    return sorted(best.values(), key=lambda h: h["score"])
+
+
+def _fuse_rrf(per_query):
+    # Reciprocal rank fusion: distances from different queries (and BM25
+    # scores) aren't comparable, ranks are. "score" stays the best distance
+    # seen (None for lexical-only hits), "bm25" the best lexical score.
+    fused = {}
+    for hits in per_query:
+        for rank, hit in enumerate(hits, start=1):
+            key = _hit_key(hit)
+            if key not in fused:
+                fused[key] = dict(hit, rrf=0.0)
+            entry = fused[key]
+            entry["rrf"] += 1.0 / (RRF_K + rank)
+            for field, better in (("score", min), ("bm25", max)):
+                if hit.get(field) is not None:
+                    current = entry.get(field)
+                    entry[field] = hit[field] if current is None else better(current, hit[field])
+            if entry.get("text") is None and hit.get("text") is not None:
+                entry["text"] = hit["text"]
+    return sorted(fused.values(), key=lambda h: h["rrf"], reverse=True)
+
+
+def _merge(per_query, k: int, fusion: str):
+    if fusion == "rrf":
+        merged = _fuse_rrf(per_query)
+    elif fusion == "min":
+        merged = _fuse_min(per_query)
+    else:
+        raise ValueError(f"Unknown fusion method: {fusion}")
+    return merged[:k]
+
+
+def retrieve_many(
+    queries: list,
+    k: int = 5,
+    n_results: int = None,
+    fusion: str = "min",
+    data_dir: str = "data",
+):
+    """
+    Embed all queries in one batched request, run one batched search on the
+    vector backend (store.backend(): Chroma or the numpy index) and return
+    the top-k merged hits, deduplicated by (source, page, chunk_id).
+    fusion: "min" (best distance) or "rrf" (reciprocal rank fusion).
+    """
+    if not queries:
+        return []
+
+    backend = store.backend(data_dir)
+    per_query = _vector_hits(backend, queries, n_results or min(30, max(10, k * 5)))
+    return _attach_text(_merge(per_query, k, fusion), data_dir)
+
+
+async def aretrieve_many(
+    queries: list,
+    k: int = 5,
+    n_results: int = None,
+    fusion: str = "min",
+    data_dir: str = "data",
+):
+    """Async retrieve_many: awaits embeddings, runs the backend search in a worker thread."""
+    if not queries:
+        return []
+
+    backend = await asyncio.to_thread(store.backend, data_dir)
+    per_query = await _avector_hits(backend, queries, n_results or min(30, max(10, k * 5)))
+    return await asyncio.to_thread(_attach_text, _merge(per_query, k, fusion), data_dir)
+
+
+def _lexical_search(index: BM25Index, queries: list, n_results: int):
+    per_query, missing = _memo_lookup("lexical", queries, n_results)
+    if missing:
+        record("lexical_searches", len(missing))
+    searched = [
+        [dict(index.hit(doc, score), text=None, score=None) for doc, score in index.search(q, n_results)]
+        for q in missing
+    ]
+    return _memo_fill("lexical", queries, n_results, per_query, searched)
+
+
+def _attach_text(hits: list, data_dir: str = "data"):
+    # Lexical and numpy hits carry chunk IDs, not text: decode just the
+    # final top-k from the memory-mapped chunk store.
+    if any(h.get("text") is None for h in hits):
+        chunks = store.chunks(data_dir)
+        for h in hits:
+            if h.get("text") is None:
+                h["text"] = chunks.text(h.get("chunk_id"))
+    for h in hits:
+        h.pop("id", None)
+    return hits
+
+
+def _hybrid_plan(index: BM25Index, queries: list, k: int, n_vector: int, n_lexical: int):
+    # Exact-term queries ("SaMD", a regulation name) skip embedding and vector search.
+    vector_queries = [q for q in queries if not index.is_exact_term_query(q)]
+    return vector_queries, n_vector or max(10, k * 2), n_lexical or max(20, k * 4)
+
+
+def retrieve_hybrid(
+    queries: list,
+    k: int = 5,
+    lexical_queries: list = (),
+    n_vector: int = None,
+    n_lexical: int = None,
+    data_dir: str = "data",
+):
+    """
+    Fuse BM25 hits (for queries and lexical_queries) with vector hits (for
+    queries only) by reciprocal rank fusion. Vector search uses a smaller
+    overfetch than vector-only retrieval, since exact terms are covered
+    lexically.
+    """
+    backend = store.backend(data_dir)
+    index = store.lexical(data_dir)
+    vector_queries, n_vector, n_lexical = _hybrid_plan(index, queries, k, n_vector, n_lexical)
+
+    per_query = []
+    if vector_queries:
+        per_query.extend(_vector_hits(backend, vector_queries, n_vector))
+    per_query.extend(_lexical_search(index, list(queries) + list(lexical_queries), n_lexical))
+    return _attach_text(_fuse_rrf(per_query)[:k], data_dir)
+
+
+async def aretrieve_hybrid(
+    queries: list,
+    k: int = 5,
+    lexical_queries: list = (),
+    n_vector: int = None,
+    n_lexical: int = None,
+    data_dir: str = "data",
+):
+    backend = await asyncio.to_thread(store.backend, data_dir)
+    index = await asyncio.to_thread(store.lexical, data_dir)
+    vector_queries, n_vector, n_lexical = _hybrid_plan(index, queries, k, n_vector, n_lexical)
+
+    per_query = []
+    if vector_queries:
+        per_query.extend(await _avector_hits(backend, vector_queries, n_vector))
+    per_query.extend(_lexical_search(index, list(queries) + list(lexical_queries), n_lexical))
+    merged = _fuse_rrf(per_query)[:k]
+    return await asyncio.to_thread(_attach_text, merged, data_dir)
 
-        formatted.append({
-            "text": doc.page_content,
-            "source": doc.metadata.get("source"),
-            "page": doc.metadata.get("page"),
-            "chunk_id": doc.metadata.get("chunk_id"),
-            "score": float(score),
-        })
 
-        if len(formatted) >= k:
-            break
+def retrieve(query: str, k: int = 5, data_dir: str = "data", mode: str = RETRIEVAL_MODE):
+    if mode == "hybrid":
+        return retrieve_hybrid([query], k=k, data_dir=data_dir)
+    return retrieve_many([query], k=k, data_dir=data_dir)
 
-    return formatted
 
+async def aretrieve(query: str, k: int = 5, data_dir: str = "data", mode: str = RETRIEVAL_MODE):
+    if mode == "hybrid":
+        return await aretrieve_hybrid([query], k=k, data_dir=data_dir)
+    return await aretrieve_many([query], k=k, data_dir=data_dir)
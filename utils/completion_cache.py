@@ -0,0 +1,129 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+from langchain_core.messages import AIMessage, AIMessageChunk
+
+from utils.metrics import record
+
+# Persistent cache of temperature-0 completions, keyed by provider, model,
+# parameters and prompt hash. COMPLETION_CACHE=off bypasses it entirely;
+# least recently used entries are evicted past COMPLETION_CACHE_MAX_MB.
+COMPLETION_CACHE = os.getenv("COMPLETION_CACHE", "on") != "off"
+CACHE_PATH = os.getenv("COMPLETION_CACHE_PATH", ".cache/completions.sqlite")
+MAX_BYTES = int(float(os.getenv("COMPLETION_CACHE_MAX_MB", "200")) * 1024 * 1024)
+
+# Usage reported for a cache hit: nothing was spent.
+NO_USAGE = {"input_tokens": 0, "output_tokens": 0, "total_tokens": 0}
+
+
+class CompletionCache:
+    """SQLite table of completions; lookups touch last_used for LRU eviction."""
+
+    def __init__(self, path: str = CACHE_PATH, max_bytes: int = MAX_BYTES, enabled: bool = COMPLETION_CACHE):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._db = None
+        self._bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _conn(self):
+        # opened on first use, so importing this module never touches disk
+        if self._db is None:
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS completions ("
+                "key TEXT PRIMARY KEY, model TEXT, content TEXT, size INTEGER, last_used REAL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS completions_lru ON completions (last_used)")
+            self._db.commit()
+            self._bytes = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM completions").fetchone()[0]
+        return self._db
+
+    def key(self, provider: str, model: str, params: dict, prompt: str) -> str:
+        prompt_hash = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        spec = json.dumps([provider, model, sorted(params.items()), prompt_hash], default=str)
+        return hashlib.sha256(spec.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            db = self._conn()
+            row = db.execute("SELECT content FROM completions WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                record("completion_cache_misses")
+                return None
+            db.execute("UPDATE completions SET last_used = ? WHERE key = ?", (time.time(), key))
+            db.commit()
+            self.hits += 1
+        record("completion_cache_hits")
+        return row[0]
+
+    def put(self, key: str, model: str, content: str):
+        size = len(content.encode("utf-8"))
+        if not content or size > self.max_bytes:
+            return
+        with self._lock:
+            db = self._conn()
+            old = db.execute("SELECT size FROM completions WHERE key = ?", (key,)).fetchone()
+            db.execute(
+                "INSERT OR REPLACE INTO completions (key, model, content, size, last_used) VALUES (?, ?, ?, ?, ?)",
+                (key, model, content, size, time.time()),
+            )
+            self._bytes += size - (old[0] if old else 0)
+            self._evict(db)
+            db.commit()
+
+    def _evict(self, db):
+        # drop least recently used rows until back under 90% of the budget
+        if self._bytes <= self.max_bytes:
+            return
+        target = self.max_bytes * 0.9
+        for key, size in db.execute("SELECT key, size FROM completions ORDER BY last_used").fetchall():
+            if self._bytes <= target:
+                break
+            db.execute("DELETE FROM completions WHERE key = ?", (key,))
+            self._bytes -= size
+            self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._conn().execute("DELETE FROM completions")
+            self._db.commit()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = self._conn().execute("SELECT COUNT(*) FROM completions").fetchone()[0]
+            total = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "entries": entries,
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
+
+
+completion_cache = CompletionCache()
+
+
+def cached_message(content: str) -> AIMessage:
+    return AIMessage(content=content, usage_metadata=NO_USAGE, response_metadata={"completion_cache": "hit"})
+
+
+def cached_chunk(content: str) -> AIMessageChunk:
+    return AIMessageChunk(content=content, usage_metadata=NO_USAGE, response_metadata={"completion_cache": "hit"})
@@ -0,0 +1,24 @@
+import asyncio
+import os
+import weakref
+
+# Max in-flight async calls per upstream service, per event loop.
+UPSTREAM_LIMITS = {
+    "chat": int(os.getenv("CHAT_CONCURRENCY", "8")),
+    "embeddings": int(os.getenv("EMBEDDINGS_CONCURRENCY", "4")),
+    "vectorstore": int(os.getenv("VECTORSTORE_CONCURRENCY", "4")),
+}
+
+_semaphores = weakref.WeakKeyDictionary()
+
+
+def upstream_limit(name: str) -> asyncio.Semaphore:
+    """
+    Semaphore bounding concurrent calls to one upstream on the running loop.
+    Usage: async with upstream_limit("chat"): ...
+    """
+    loop = asyncio.get_running_loop()
+    per_loop = _semaphores.setdefault(loop, {})
+    if name not in per_loop:
+        per_loop[name] = asyncio.Semaphore(UPSTREAM_LIMITS[name])
+    return per_loop[name]
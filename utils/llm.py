@@ -0,0 +1,351 @@
+import asyncio
+import contextlib
+import contextvars
+import heapq
+import itertools
+import os
+import random
+import threading
+import time
+
+from utils.completion_cache import cached_chunk, cached_message, completion_cache
+from utils.metrics import record
+from utils.providers import LLM_PROVIDER, get_chat_model
+
+# Provider budgets shared by every LLM call in the process (0 = unlimited).
+# The offline fake model has no limits to respect. The budget is per
+# process: the app and a concurrent run_eval each assume the full limits and
+# don't see each other's priorities, so split LLM_RPM/LLM_TPM between them.
+LLM_RPM = int(os.getenv("LLM_RPM", "0" if LLM_PROVIDER == "fake" else "500"))
+LLM_TPM = int(os.getenv("LLM_TPM", "0" if LLM_PROVIDER == "fake" else "200000"))
+
+# Tokens reserved per call before the real usage is known: the prompt
+# (~4 chars per token) plus this much completion. Settled afterwards.
+COMPLETION_TOKENS_ESTIMATE = int(os.getenv("LLM_COMPLETION_TOKENS_ESTIMATE", "800"))
+
+# Retries with full-jitter exponential backoff; a Retry-After from the
+# provider is a floor. A 429 pauses the whole scheduler; transient failures
+# (5xx, timeouts, connection errors) back off only the failing call.
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "5"))
+BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "0.5"))
+BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "30"))
+
+# Waiting calls are served by priority, then arrival: interactive (the
+# Streamlit app, the default) before batch (run_eval, run_batch).
+PRIORITIES = {"interactive": 0, "batch": 1}
+_priority = contextvars.ContextVar("llm_priority", default="interactive")
+
+
+@contextlib.contextmanager
+def llm_priority(name: str):
+    if name not in PRIORITIES:
+        raise ValueError(f"Unknown LLM priority: {name}")
+    token = _priority.set(name)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class RateScheduler:
+    """
+    Token buckets for requests and tokens per minute. A call takes one
+    request and its estimated tokens before it is sent; only the
+    highest-priority waiter may take, so batch traffic can't starve
+    interactive requests.
+    """
+
+    def __init__(self, rpm: int = LLM_RPM, tpm: int = LLM_TPM):
+        self.rpm = rpm
+        self.tpm = tpm
+        self._requests = float(rpm)
+        self._tokens = float(tpm)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._queue = []  # heap of (priority, seq) tickets
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self.waited_seconds = 0.0
+        self.rate_limited = 0
+
+    def _refill(self, now: float):
+        elapsed = now - self._updated
+        self._updated = now
+        if self.rpm:
+            self._requests = min(self.rpm, self._requests + elapsed * self.rpm / 60)
+        if self.tpm:
+            self._tokens = min(self.tpm, self._tokens + elapsed * self.tpm / 60)
+
+    def _enter(self, priority: str):
+        ticket = (PRIORITIES[priority], next(self._seq))
+        heapq.heappush(self._queue, ticket)
+        return ticket
+
+    def _leave(self, ticket):
+        if ticket in self._queue:
+            self._queue.remove(ticket)
+            heapq.heapify(self._queue)
+            self._cond.notify_all()
+
+    def _try_take(self, ticket, tokens: int) -> float:
+        # 0.0 once taken, else seconds until it might succeed (caller holds _cond)
+        now = time.monotonic()
+        self._refill(now)
+        if self._queue[0] != ticket:
+            return 0.05
+        wait = self._paused_until - now
+        if self.rpm and self._requests < 1:
+            wait = max(wait, (1 - self._requests) * 60 / self.rpm)
+        if self.tpm and self._tokens < tokens:
+            wait = max(wait, (tokens - self._tokens) * 60 / self.tpm)
+        if wait > 0:
+            return wait
+
+        if self.rpm:
+            self._requests -= 1
+        if self.tpm:
+            self._tokens -= tokens
+        heapq.heappop(self._queue)
+        self._cond.notify_all()
+        return 0.0
+
+    def _clamp(self, tokens: int) -> int:
+        return min(tokens, self.tpm) if self.tpm else tokens
+
+    def _waited(self, start: float):
+        waited = time.monotonic() - start
+        if waited > 0.001:
+            with self._cond:
+                self.waited_seconds += waited
+            record("llm_wait_seconds", round(waited, 4))
+
+    def acquire(self, tokens: int, priority: str = None):
+        tokens = self._clamp(tokens)
+        start = time.monotonic()
+        with self._cond:
+            ticket = self._enter(priority or _priority.get())
+            try:
+                wait = self._try_take(ticket, tokens)
+                while wait > 0:
+                    self._cond.wait(wait)
+                    wait = self._try_take(ticket, tokens)
+            except BaseException:
+                self._leave(ticket)
+                raise
+        self._waited(start)
+
+    async def aacquire(self, tokens: int, priority: str = None):
+        tokens = self._clamp(tokens)
+        start = time.monotonic()
+        with self._cond:
+            ticket = self._enter(priority or _priority.get())
+        try:
+            while True:
+                with self._cond:
+                    wait = self._try_take(ticket, tokens)
+                if wait <= 0:
+                    break
+                await asyncio.sleep(wait)
+        except BaseException:
+            with self._cond:
+                self._leave(ticket)
+            raise
+        self._waited(start)
+
+    def settle(self, estimated: int, actual: int):
+        # swap the reservation for the provider-reported usage
+        if not self.tpm or actual is None:
+            return
+        with self._cond:
+            self._tokens = min(self.tpm, self._tokens + self._clamp(estimated) - actual)
+            self._cond.notify_all()
+
+    def pause(self, seconds: float):
+        with self._cond:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self.rate_limited += 1
+
+    def stats(self) -> dict:
+        with self._cond:
+            self._refill(time.monotonic())
+            return {
+                "rpm": self.rpm,
+                "tpm": self.tpm,
+                "requests_available": round(self._requests, 2),
+                "tokens_available": round(self._tokens),
+                "waiting": len(self._queue),
+                "waited_seconds": round(self.waited_seconds, 3),
+                "rate_limited": self.rate_limited,
+            }
+
+
+scheduler = RateScheduler()
+
+
+def _estimate(prompt: str) -> int:
+    return len(prompt) // 4 + COMPLETION_TOKENS_ESTIMATE
+
+
+def _used_tokens(message):
+    usage = getattr(message, "usage_metadata", None) or {}
+    return usage.get("total_tokens")
+
+
+# openai and httpx exception classes (matched by name anywhere in the MRO)
+# worth another attempt
+TRANSIENT_ERRORS = {"APIConnectionError", "APITimeoutError", "InternalServerError", "TransportError"}
+
+
+def _is_rate_limit(exc: Exception) -> bool:
+    return getattr(exc, "status_code", None) == 429 or type(exc).__name__ == "RateLimitError"
+
+
+def _is_transient(exc: Exception) -> bool:
+    status = getattr(exc, "status_code", None)
+    if isinstance(status, int) and status >= 500:
+        return True
+    return any(cls.__name__ in TRANSIENT_ERRORS for cls in type(exc).__mro__)
+
+
+def _backoff(exc: Exception, attempt: int) -> float:
+    headers = getattr(getattr(exc, "response", None), "headers", None) or {}
+    try:
+        retry_after = float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        retry_after = 0.0
+    delay = random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+    return max(delay, retry_after)
+
+
+def _retry_or_raise(exc: Exception, attempt: int) -> float:
+    """Seconds the failing call should sleep before its next attempt; re-raises
+    errors that aren't worth retrying or have used up LLM_MAX_RETRIES."""
+    if attempt >= LLM_MAX_RETRIES:
+        raise exc
+    if _is_rate_limit(exc):
+        record("llm_rate_limited")
+        scheduler.pause(_backoff(exc, attempt))
+        return 0.0
+    if _is_transient(exc):
+        record("llm_transient_errors")
+        return _backoff(exc, attempt)
+    raise exc
+
+
+def _cache_key(prompt: str, model: str, temperature: float, params: dict, cache: bool):
+    # only deterministic calls are cached; stream_usage doesn't change the text
+    if not (cache and completion_cache.enabled and temperature == 0):
+        return None
+    params = {k: v for k, v in params.items() if k != "stream_usage"}
+    return completion_cache.key(LLM_PROVIDER, model, dict(params, temperature=temperature), prompt)
+
+
+def chat(prompt: str, model: str = "gpt-4o-mini", temperature: float = 0, cache: bool = True, **params):
+    """
+    One scheduled chat completion through the shared client registry.
+    Temperature-0 calls are served from the completion cache unless cache=False.
+    """
+    key = _cache_key(prompt, model, temperature, params, cache)
+    content = completion_cache.get(key) if key else None
+    if content is not None:
+        return cached_message(content)
+
+    llm = get_chat_model(model, temperature=temperature, **params)
+    estimate = _estimate(prompt)
+    for attempt in itertools.count():
+        scheduler.acquire(estimate)
+        try:
+            response = llm.invoke(prompt)
+        except Exception as exc:
+            time.sleep(_retry_or_raise(exc, attempt))
+            continue
+        scheduler.settle(estimate, _used_tokens(response))
+        if key:
+            completion_cache.put(key, model, response.content)
+        return response
+
+
+async def achat(prompt: str, model: str = "gpt-4o-mini", temperature: float = 0, cache: bool = True, **params):
+    key = _cache_key(prompt, model, temperature, params, cache)
+    content = completion_cache.get(key) if key else None
+    if content is not None:
+        return cached_message(content)
+
+    llm = get_chat_model(model, temperature=temperature, **params)
+    estimate = _estimate(prompt)
+    for attempt in itertools.count():
+        await scheduler.aacquire(estimate)
+        try:
+            response = await llm.ainvoke(prompt)
+        except Exception as exc:
+            await asyncio.sleep(_retry_or_raise(exc, attempt))
+            continue
+        scheduler.settle(estimate, _used_tokens(response))
+        if key:
+            completion_cache.put(key, model, response.content)
+        return response
+
+
+def stream_chat(prompt: str, model: str = "gpt-4o-mini", temperature: float = 0, cache: bool = True, **params):
+    """
+    Scheduled streaming completion yielding message chunks. Errors are only
+    retried before the first chunk; after that the error propagates.
+    A cached completion arrives as a single chunk.
+    """
+    key = _cache_key(prompt, model, temperature, params, cache)
+    content = completion_cache.get(key) if key else None
+    if content is not None:
+        yield cached_chunk(content)
+        return
+
+    llm = get_chat_model(model, temperature=temperature, **params)
+    estimate = _estimate(prompt)
+    for attempt in itertools.count():
+        scheduler.acquire(estimate)
+        parts = []
+        usage = None
+        try:
+            for chunk in llm.stream(prompt):
+                parts.append(chunk.content)
+                if chunk.usage_metadata:
+                    usage = chunk
+                yield chunk
+        except Exception as exc:
+            if parts:
+                raise
+            time.sleep(_retry_or_raise(exc, attempt))
+            continue
+        scheduler.settle(estimate, _used_tokens(usage))
+        if key:
+            completion_cache.put(key, model, "".join(p for p in parts if isinstance(p, str)))
+        return
+
+
+async def astream_chat(prompt: str, model: str = "gpt-4o-mini", temperature: float = 0, cache: bool = True, **params):
+    key = _cache_key(prompt, model, temperature, params, cache)
+    content = completion_cache.get(key) if key else None
+    if content is not None:
+        yield cached_chunk(content)
+        return
+
+    llm = get_chat_model(model, temperature=temperature, **params)
+    estimate = _estimate(prompt)
+    for attempt in itertools.count():
+        await scheduler.aacquire(estimate)
+        parts = []
+        usage = None
+        try:
+            async for chunk in llm.astream(prompt):
+                parts.append(chunk.content)
+                if chunk.usage_metadata:
+                    usage = chunk
+                yield chunk
+        except Exception as exc:
+            if parts:
+                raise
+            await asyncio.sleep(_retry_or_raise(exc, attempt))
+            continue
+        scheduler.settle(estimate, _used_tokens(usage))
+        if key:
+            completion_cache.put(key, model, "".join(p for p in parts if isinstance(p, str)))
+        return
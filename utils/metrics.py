@@ -0,0 +1,214 @@
+import asyncio
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+import uuid
+from collections import defaultdict
+from pathlib import Path
+
+# Optional exports: OpenTelemetry-style spans (one JSON object per line) and a
+# Prometheus text-format file rewritten after every span (textfile collector).
+SPANS_FILE = os.getenv("METRICS_SPANS_FILE", "")
+PROMETHEUS_FILE = os.getenv("METRICS_PROMETHEUS_FILE", "")
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_current_span = contextvars.ContextVar("metrics_span", default=None)
+
+
+class Span:
+    __slots__ = ("node", "trace_id", "span_id", "start", "seconds", "counters")
+
+    def __init__(self, node: str, trace_id: str):
+        self.node = node
+        self.trace_id = trace_id
+        self.span_id = uuid.uuid4().hex[:16]
+        self.start = time.time()
+        self.seconds = 0.0
+        self.counters = defaultdict(int)
+
+    def to_dict(self) -> dict:
+        return {
+            "node": self.node,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "start": self.start,
+            "seconds": round(self.seconds, 6),
+            **self.counters,
+        }
+
+
+class Histogram:
+    """Cumulative bucket counts plus sum and count, as Prometheus exposes them."""
+
+    __slots__ = ("buckets", "sum", "count")
+
+    def __init__(self):
+        self.buckets = [0] * len(LATENCY_BUCKETS)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if value <= bound:
+                self.buckets[i] += 1
+        self.sum += value
+        self.count += 1
+
+
+class MetricsSink:
+    """Process-wide aggregates of node spans and counters, exportable as Prometheus text."""
+
+    def __init__(self, spans_file: str = SPANS_FILE, prometheus_file: str = PROMETHEUS_FILE):
+        self.spans_file = spans_file
+        self.prometheus_file = prometheus_file
+        self._lock = threading.Lock()
+        self.node_seconds = defaultdict(Histogram)
+        self.node_counters = defaultdict(lambda: defaultdict(int))
+        self.events = defaultdict(int)
+
+    def add_span(self, span: Span):
+        with self._lock:
+            self.node_seconds[span.node].observe(span.seconds)
+            for name, value in span.counters.items():
+                self.node_counters[span.node][name] += value
+
+            if self.spans_file:
+                Path(self.spans_file).parent.mkdir(parents=True, exist_ok=True)
+                with open(self.spans_file, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(_otel_span(span)) + "\n")
+            if self.prometheus_file:
+                Path(self.prometheus_file).write_text(self._render(), encoding="utf-8")
+
+    def add_event(self, name: str, value: int = 1):
+        with self._lock:
+            self.events[name] += value
+
+    def _render(self) -> str:
+        lines = [
+            "# HELP copilot_node_duration_seconds Wall time per workflow node.",
+            "# TYPE copilot_node_duration_seconds histogram",
+        ]
+        for node, hist in sorted(self.node_seconds.items()):
+            for bucket, count in zip(LATENCY_BUCKETS, hist.buckets):
+                lines.append(f'copilot_node_duration_seconds_bucket{{node="{node}",le="{bucket}"}} {count}')
+            lines.append(f'copilot_node_duration_seconds_bucket{{node="{node}",le="+Inf"}} {hist.count}')
+            lines.append(f'copilot_node_duration_seconds_sum{{node="{node}"}} {hist.sum:.6f}')
+            lines.append(f'copilot_node_duration_seconds_count{{node="{node}"}} {hist.count}')
+
+        lines.append("# TYPE copilot_node_events_total counter")
+        for node, counters in sorted(self.node_counters.items()):
+            for name, value in sorted(counters.items()):
+                lines.append(f'copilot_node_events_total{{node="{node}",event="{name}"}} {value}')
+
+        lines.append("# TYPE copilot_events_total counter")
+        for name, value in sorted(self.events.items()):
+            lines.append(f'copilot_events_total{{event="{name}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+    def render_prometheus(self) -> str:
+        with self._lock:
+            return self._render()
+
+
+def _otel_span(span: Span) -> dict:
+    return {
+        "name": span.node,
+        "trace_id": span.trace_id,
+        "span_id": span.span_id,
+        "start_time_unix_nano": int(span.start * 1e9),
+        "end_time_unix_nano": int((span.start + span.seconds) * 1e9),
+        "attributes": dict(span.counters),
+    }
+
+
+sink = MetricsSink()
+
+
+def record(name: str, value: int = 1):
+    """Count an event against the running node's span (and the process totals)."""
+    span = _current_span.get()
+    if span is not None:
+        span.counters[name] += value
+    sink.add_event(name, value)
+
+
+def record_llm_usage(message):
+    # AIMessage / final AIMessageChunk carry usage_metadata when the provider reports it.
+    if (getattr(message, "response_metadata", None) or {}).get("completion_cache") == "hit":
+        return  # served from utils.completion_cache, nothing spent
+    record("llm_calls")
+    usage = getattr(message, "usage_metadata", None) or {}
+    if usage:
+        record("prompt_tokens", usage.get("input_tokens", 0))
+        record("completion_tokens", usage.get("output_tokens", 0))
+
+
+def _start(node: str, state: dict):
+    span = Span(node, state.get("trace_id") or uuid.uuid4().hex)
+    return span, _current_span.set(span)
+
+
+def _finish(span: Span, token, state: dict, update):
+    span.seconds = time.time() - span.start
+    _current_span.reset(token)
+    sink.add_span(span)
+
+    update = dict(update or {})
+    update["metrics"] = [span.to_dict()]
+    if not state.get("trace_id"):
+        update["trace_id"] = span.trace_id
+    return update
+
+
+def instrument(node: str, fn):
+    """
+    Wrap a graph node (sync or async): time it, collect counters recorded
+    while it runs, and append the span to state["metrics"].
+    """
+    if asyncio.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def async_wrapper(state):
+            span, token = _start(node, state)
+            try:
+                update = await fn(state)
+            except BaseException:
+                span.counters["errors"] += 1
+                _finish(span, token, state, None)
+                raise
+            return _finish(span, token, state, update)
+        return async_wrapper
+
+    @functools.wraps(fn)
+    def wrapper(state):
+        span, token = _start(node, state)
+        try:
+            update = fn(state)
+        except BaseException:
+            span.counters["errors"] += 1
+            _finish(span, token, state, None)
+            raise
+        return _finish(span, token, state, update)
+    return wrapper
+
+
+def summarize(metrics: list) -> dict:
+    """Totals over a request's spans, e.g. for the UI metrics row or eval reports."""
+    nodes = defaultdict(float)
+    totals = defaultdict(int)
+    for span in metrics or []:
+        nodes[span["node"]] += span.get("seconds", 0.0)
+        for key, value in span.items():
+            if key not in ("node", "trace_id", "span_id", "start", "seconds") and isinstance(value, (int, float)):
+                totals[key] += value
+
+    if metrics:
+        start = min(s["start"] for s in metrics)
+        end = max(s["start"] + s.get("seconds", 0.0) for s in metrics)
+        wall = end - start
+    else:
+        wall = 0.0
+    return {"wall_seconds": round(wall, 4), "node_seconds": dict(nodes), **totals}
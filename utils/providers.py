@@ -0,0 +1,252 @@
+import asyncio
+import hashlib
+import math
+import os
+import re
+import threading
+import time
+import weakref
+from functools import lru_cache
+from typing import Any, Iterator, List, Optional
+
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+# "openai" (default) or offline stand-ins: "fake" chat model, "hashing" embeddings.
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "openai")
+EMBEDDINGS_PROVIDER = os.getenv("EMBEDDINGS_PROVIDER", "openai")
+
+# Simulated latency of the fake chat model: once per call, and per streamed token.
+FAKE_LLM_LATENCY = float(os.getenv("FAKE_LLM_LATENCY", "0"))
+FAKE_LLM_TOKEN_LATENCY = float(os.getenv("FAKE_LLM_TOKEN_LATENCY", "0"))
+HASHING_DIM = int(os.getenv("HASHING_EMBEDDINGS_DIM", "512"))
+
+# Keep-alive connection pools (one sync, one async) shared by every OpenAI
+# client in the process.
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "64"))
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "60"))
+
+_WORD = re.compile(r"[a-z0-9]+")
+_CONTEXT_BLOCK = re.compile(r"^\[([^\]\n]+ p\.[^\]\n]*)\]\n(.*?)(?=\n\n\[|\n\nQuestion:|\Z)", re.DOTALL | re.MULTILINE)
+
+
+def _first_sentence(text: str, max_words: int = 25) -> str:
+    sentence = re.split(r"(?<=[.!?])\s+", " ".join(text.split()), maxsplit=1)[0]
+    words = sentence.split()
+    return " ".join(words[:max_words]).rstrip(".") + "."
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Deterministic offline chat model. Writer prompts (with a Context section)
+    get a fully structured answer citing the context tags verbatim; any other
+    prompt gets a short numbered plan. Output depends only on the prompt.
+    """
+
+    latency: float = FAKE_LLM_LATENCY
+    token_latency: float = FAKE_LLM_TOKEN_LATENCY
+    model_name: str = "fake-chat"
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    def _respond(self, prompt: str) -> str:
+        question = prompt.rsplit("Question:", 1)[-1].strip() if "Question:" in prompt else prompt.strip()
+        question = question.splitlines()[-1] if question else "the request"
+        evidence = _CONTEXT_BLOCK.findall(prompt.split("Context:", 1)[1]) if "Context:" in prompt else []
+
+        if not evidence:
+            return "\n".join([
+                f"1. Clarify the scope of: {question}",
+                "2. Retrieve governance, safety and adoption evidence from the corpus.",
+                "3. Draft the executive summary, email and action list with citations.",
+                "4. Verify every claim against the cited chunks.",
+            ])
+
+        top = evidence[:4]
+        summary = " ".join(f"{_first_sentence(text)} [{tag}]" for tag, text in top[:3])
+        risks = "\n".join(f"- {_first_sentence(text, 15)} Mitigation: review with governance board. [{tag}]" for tag, text in top)
+        sources = "\n".join(f"- [{tag}]" for tag, _ in top)
+        return f"""### Executive Summary
+{summary}
+
+### Client-ready Email
+Subject: Recommendations on {question[:60]}
+
+Dear Leadership Team,
+
+Please find below a summary of the evidence and proposed next steps [{top[0][0]}].
+
+Best regards,
+Healthcare AI Advisory
+
+### Action List
+| Owner | Due Date | Confidence |
+|---|---|---|
+| CMIO | 30 days | High |
+| Compliance Lead | 60 days | Medium |
+
+### Key Risks and Mitigation
+{risks}
+
+### Sources
+{sources}
+"""
+
+    def _prompt(self, messages) -> str:
+        return "\n".join(str(m.content) for m in messages)
+
+    def _usage(self, prompt: str, text: str) -> dict:
+        prompt_tokens = len(prompt.split())
+        completion_tokens = len(text.split())
+        return {
+            "input_tokens": prompt_tokens,
+            "output_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        }
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs: Any) -> ChatResult:
+        prompt = self._prompt(messages)
+        if self.latency:
+            time.sleep(self.latency)
+        text = self._respond(prompt)
+        message = AIMessage(content=text, usage_metadata=self._usage(prompt, text))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        prompt = self._prompt(messages)
+        if self.latency:
+            time.sleep(self.latency)
+        text = self._respond(prompt)
+
+        for token in re.findall(r"\S+\s*|\s+", text):
+            if self.token_latency:
+                time.sleep(self.token_latency)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager:
+                run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+        yield ChatGenerationChunk(message=AIMessageChunk(content="", usage_metadata=self._usage(prompt, text)))
+
+
+class HashingEmbeddings(Embeddings):
+    """
+    Local embeddings: signed feature hashing of word unigrams and bigrams,
+    L2-normalized. No network, deterministic across processes.
+    """
+
+    def __init__(self, dim: int = HASHING_DIM):
+        self.dim = dim
+        self.model = f"hashing-{dim}"
+
+    def _embed(self, text: str) -> List[float]:
+        vector = [0.0] * self.dim
+        words = _WORD.findall(text.lower())
+        for feature in words + [f"{a} {b}" for a, b in zip(words, words[1:])]:
+            digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+            bucket = int.from_bytes(digest[:4], "little") % self.dim
+            vector[bucket] += 1.0 if digest[4] & 1 else -1.0
+
+        norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+        return [v / norm for v in vector]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(t) for t in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text)
+
+
+def _http_options() -> dict:
+    import httpx
+
+    return {
+        "limits": httpx.Limits(max_connections=HTTP_MAX_CONNECTIONS, max_keepalive_connections=HTTP_MAX_CONNECTIONS),
+        "timeout": httpx.Timeout(HTTP_TIMEOUT, connect=10.0),
+    }
+
+
+@lru_cache(maxsize=1)
+def http_client():
+    import httpx
+
+    return httpx.Client(**_http_options())
+
+
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def _loop_async_client():
+    # one pool per event loop, like utils.limits' semaphores
+    import httpx
+
+    loop = asyncio.get_running_loop()
+    if loop not in _async_clients:
+        # a pooled connection keeps its loop alive, so forget closed loops here
+        for closed in [other for other in _async_clients if other.is_closed()]:
+            del _async_clients[closed]
+        _async_clients[loop] = httpx.AsyncClient(**_http_options())
+    return _async_clients[loop]
+
+
+@lru_cache(maxsize=1)
+def http_async_client():
+    """
+    Async client for ainvoke/astream and async embeddings. httpx connections
+    belong to the event loop that opened them, so this one object (the
+    clients hold on to it) sends each request through the running loop's pool.
+    """
+    import httpx
+
+    class LoopLocalAsyncClient(httpx.AsyncClient):
+        async def send(self, request, **kwargs):
+            return await _loop_async_client().send(request, **kwargs)
+
+    return LoopLocalAsyncClient(**_http_options())
+
+
+_models = {}
+_models_lock = threading.Lock()
+
+
+def _create_chat_model(provider: str, model: str, temperature: float, **kwargs):
+    if provider == "fake":
+        return FakeChatModel(model_name=f"fake-{model}")
+    if provider == "openai":
+        from langchain_openai import ChatOpenAI
+
+        # retries (429s, 5xx, timeouts, connection errors) are done by
+        # utils.llm, in step with its scheduler
+        return ChatOpenAI(
+            model=model,
+            temperature=temperature,
+            http_client=http_client(),
+            http_async_client=http_async_client(),
+            max_retries=0,
+            **kwargs,
+        )
+    raise ValueError(f"Unknown LLM_PROVIDER: {provider}")
+
+
+def get_chat_model(model: str = "gpt-4o-mini", temperature: float = 0, **kwargs):
+    """Chat model instances are created once per (model, parameters) and reused.
+    Agents call them through utils.llm, which adds rate scheduling and retries."""
+    key = (LLM_PROVIDER, model, temperature, tuple(sorted(kwargs.items())))
+    with _models_lock:
+        if key not in _models:
+            _models[key] = _create_chat_model(LLM_PROVIDER, model, temperature, **kwargs)
+        return _models[key]
+
+
+def get_embeddings(provider: Optional[str] = None):
+    provider = provider or EMBEDDINGS_PROVIDER
+    if provider == "hashing":
+        return HashingEmbeddings()
+    if provider == "openai":
+        from langchain_openai import OpenAIEmbeddings
+
+        return OpenAIEmbeddings(http_client=http_client(), http_async_client=http_async_client())
+    raise ValueError(f"Unknown EMBEDDINGS_PROVIDER: {provider}")